@@ -0,0 +1,282 @@
+import ast
+import operator
+
+from alloy.generator import AlloyGenerator
+
+# Only operations that give the same result in Python as on a scoreboard are folded. Division and modulo round
+# differently, and Python's / makes floats
+BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul
+}
+
+UNARY_OPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Invert: operator.invert,
+    ast.Not: lambda v: int(not v)
+}
+
+COMPARE_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge
+}
+
+# Expressions with their own scope, names in them aren't the frame's
+SCOPES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+# Scores are 32 bit
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+def fold_module(tree: ast.Module) -> ast.Module:
+    folder = ConstantFolder()
+    tree.body = AlloyGenerator.run(folder.fold_body(tree.body, {}))
+    return tree
+
+
+class ConstantFolder:
+    def __init__(self):
+        """
+        Folds int expressions made of constants, and propagates the constants assigned to names through each frame,
+        before any Alloy is generated. If statements whose test folds to a constant are replaced by their live branch
+        and while loops that never run are removed. Comparisons fold to 1 or 0, the same as CompareOp leaves them
+        """
+
+    def fold_body(self, body: list, env: dict):
+        """
+        Generator visitor that folds a list of statements, run it with AlloyGenerator.run or yield it from a visitor
+        :param env: int value of every name known to be constant where the statements start. It is updated to the
+        names known to be constant after them
+        :return: the folded statements
+        """
+        out = []
+
+        for node in body:
+            if isinstance(node, ast.If):
+                node.test = self.fold_expr(node.test, env)
+                value = constant(node.test)
+                if value is not None:
+                    # Only the live branch is kept, in place of the if statement
+                    out += yield self.fold_body(node.body if value else node.orelse, env)
+                    continue
+
+                true_env, false_env = dict(env), dict(env)
+                node.body = required((yield self.fold_body(node.body, true_env)), node)
+                node.orelse = yield self.fold_body(node.orelse, false_env)
+
+                # Only what both branches agree on is known after the if statement
+                merged = {name: v for name, v in true_env.items() if false_env.get(name) == v}
+                env.clear()
+                env.update(merged)
+
+            elif isinstance(node, ast.While):
+                # The loop can run any number of times, so nothing it assigns is known in it or after it
+                for name in assigned_names(node):
+                    env.pop(name, None)
+                if has_direct_names(node):
+                    env.clear()
+
+                node.test = self.fold_expr(node.test, env)
+                if constant(node.test) == 0 and not node.orelse:
+                    continue
+
+                node.body = required((yield self.fold_body(node.body, dict(env))), node)
+
+            elif isinstance(node, ast.FunctionDef):
+                # A function is its own frame, none of this frame's names are known in it
+                node.body = required((yield self.fold_body(node.body, {})), node)
+                env.pop(node.name, None)
+
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                if node.value is not None:
+                    node.value = self.fold_expr(node.value, env)
+
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for name in target_names(target):
+                        env.pop(name, None)
+
+                value = constant(node.value) if node.value is not None else None
+                if len(targets) == 1 and isinstance(targets[0], ast.Name) and value is not None:
+                    env[targets[0].id] = value
+
+            elif isinstance(node, ast.AugAssign):
+                node.value = self.fold_expr(node.value, env)
+                value = constant(node.value)
+                name = node.target.id if isinstance(node.target, ast.Name) else None
+
+                result = None
+                if name in env and value is not None and type(node.op) in BINARY_OPS:
+                    result = in_range(BINARY_OPS[type(node.op)](env[name], value))
+
+                if result is not None:
+                    target = ast.copy_location(ast.Name(id=name, ctx=ast.Store()), node.target)
+                    node = ast.copy_location(ast.Assign(targets=[target], value=num(result, node.value)), node)
+                    env[name] = result
+                elif name is not None:
+                    env.pop(name, None)
+
+            elif isinstance(node, ast.Expr):
+                if is_direct(node):
+                    # Direct commands can change any name
+                    if "Names." in node.value.s:
+                        env.clear()
+                else:
+                    node.value = self.fold_expr(node.value, env)
+
+            elif isinstance(node, ast.Return):
+                if node.value is not None:
+                    node.value = self.fold_expr(node.value, env)
+
+            elif not isinstance(node, ast.Pass):
+                # Nothing is known about statements MCAlloy doesn't support, the generator reports them
+                env.clear()
+
+            out.append(node)
+
+        return out
+
+    def fold_expr(self, node: ast.expr, env: dict) -> ast.expr:
+        """
+        Fold an expression, children before their parents
+        :return: the folded expression
+        """
+        # Walked without recursion, expressions can be nested deeper than the recursion limit
+        order = []
+        work = [node]
+        while work:
+            n = work.pop()
+            order.append(n)
+            if not isinstance(n, SCOPES):
+                work.extend(ast.iter_child_nodes(n))
+
+        folded = {}  # id of each node that was folded, to what it folded to
+        for n in reversed(order):
+            for field, value in ast.iter_fields(n):
+                if isinstance(value, ast.AST) and id(value) in folded:
+                    setattr(n, field, folded[id(value)])
+                elif isinstance(value, list):
+                    value[:] = [folded.get(id(v), v) for v in value]
+
+            result = self.fold_node(n, env)
+            if result is not None:
+                folded[id(n)] = num(result, n)
+
+        return folded.get(id(node), node)
+
+    @staticmethod
+    def fold_node(node: ast.expr, env: dict):
+        """
+        :return: the int value of node, if its children have been folded to constants, or None
+        """
+        if isinstance(node, ast.Name):
+            return env.get(node.id) if isinstance(node.ctx, ast.Load) else None
+
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            left, right = constant(node.left), constant(node.right)
+            if left is not None and right is not None:
+                return in_range(BINARY_OPS[type(node.op)](left, right))
+
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+            value = constant(node.operand)
+            if value is not None:
+                return in_range(UNARY_OPS[type(node.op)](value))
+
+        elif isinstance(node, ast.Compare) and all(type(op) in COMPARE_OPS for op in node.ops):
+            values = [constant(node.left)] + [constant(c) for c in node.comparators]
+            if None not in values:
+                pairs = zip(node.ops, values, values[1:])
+                return int(all(COMPARE_OPS[type(op)](a, b) for op, a, b in pairs))
+
+        elif isinstance(node, ast.BoolOp):
+            values = [constant(v) for v in node.values]
+            if None not in values:
+                # and gives the first false value, or gives the first true value, otherwise both give the last
+                stop = (lambda v: not v) if isinstance(node.op, ast.And) else bool
+                return next((v for v in values if stop(v)), values[-1])
+
+        return None
+
+
+def constant(node: ast.expr):
+    """
+    :return: the int value of node if it is an int constant, True and False count as 1 and 0, otherwise None
+    """
+    if isinstance(node, ast.Num) and type(node.n) is int:
+        return node.n
+    if isinstance(node, ast.NameConstant) and type(node.value) is bool:
+        return int(node.value)
+    return None
+
+
+def num(value: int, node: ast.AST) -> ast.Num:
+    return ast.copy_location(ast.Num(n=value), node)
+
+
+def in_range(value: int):
+    return value if INT_MIN <= value <= INT_MAX else None
+
+
+def required(body: list, parent: ast.stmt) -> list:
+    """
+    Bodies can't be empty, give ones that were folded away a pass
+    """
+    return body or [ast.copy_location(ast.Pass(), parent)]
+
+
+def target_names(target: ast.expr) -> list:
+    """
+    Names an assignment target binds, attributes and subscripts of names don't bind them
+    """
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [name for elt in target.elts for name in target_names(elt)]
+    if isinstance(target, ast.Starred):
+        return target_names(target.value)
+    return []
+
+
+def assigned_names(node: ast.stmt) -> set:
+    """
+    Every name a statement and the statements in it assign, not counting the bodies of functions defined in it
+    """
+    names = set()
+    work = [node]
+    while work:
+        n = work.pop()
+        if isinstance(n, (ast.FunctionDef, ast.ClassDef)):
+            names.add(n.name)
+            if n is not node:
+                continue
+        elif isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+            names.add(n.id)
+        work.extend(ast.iter_child_nodes(n))
+    return names
+
+
+def has_direct_names(node: ast.stmt) -> bool:
+    """
+    Whether a direct command in a statement, or in the statements in it, uses names of the frame. Direct commands in
+    the bodies of functions defined in it use the names of their own frame
+    """
+    work = [node]
+    while work:
+        n = work.pop()
+        if isinstance(n, (ast.FunctionDef, ast.ClassDef)) and n is not node:
+            continue
+        if isinstance(n, ast.Expr) and is_direct(n) and "Names." in n.value.s:
+            return True
+        work.extend(ast.iter_child_nodes(n))
+    return False
+
+
+def is_direct(stmt: ast.Expr) -> bool:
+    return isinstance(stmt.value, ast.Str) and stmt.value.s.startswith("/")
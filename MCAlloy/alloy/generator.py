@@ -1,18 +1,25 @@
 import ast
+import sys
 from ast import NodeVisitor
 from dis import Bytecode
 import error
 
 from alloy.nodes import *
+from alloy.slicer import CodeSlicer
 import types
 
+# Deepest tree compile_deep raises the recursion limit for, a quarter of the depth where compile() runs out of C stack
+MAX_DEPTH = 10000
+
 
 class AlloyGenerator(NodeVisitor):
-    def __init__(self, mod_path, doc, source_path):
+    def __init__(self, mod_path, doc, source_path, gs):
+        self.gs = gs
         self.fptr_count = 0
         self.mod_path = mod_path
         self.module = None
         self.frame_stack = []
+        self.slicer_stack = []
         self.block = None
         self.doc = doc
         self.source_path = source_path
@@ -22,17 +29,58 @@ class AlloyGenerator(NodeVisitor):
     def frame_path(self):
         return self.frame_stack[-1].path
 
+    @staticmethod
+    def run(gen):
+        """
+        Run a generator visitor to completion. Visitors that nest blocks yield the generator that buds them, which is
+        run here and its result sent back, instead of being called recursively. This keeps the Python stack flat however
+        deeply the source is nested
+        :return: the value the visitor returned
+        """
+        stack = [gen]
+        value = None
+        exc = None
+
+        while True:
+            try:
+                if exc is not None:
+                    child = stack[-1].throw(exc)
+                else:
+                    child = stack[-1].send(value)
+            except StopIteration as e:
+                stack.pop()
+                value, exc = e.value, None
+                if not stack:
+                    return value
+                continue
+            except Exception as e:
+                # Raise it in whatever yielded the generator that raised, as if it had been called directly
+                stack.pop()
+                if not stack:
+                    raise
+                value, exc = None, e
+                continue
+
+            stack.append(child)
+            value, exc = None, None
+
     def resolve_frame(self, nodes, code, name, args=None):
         self.frame_stack.append(Frame(self.module.path, name, code))
+        self.slicer_stack.append(CodeSlicer(code, nodes) if self.gs.slice_bytecode else None)
         old_block = self.block
         self.block = Block(self.frame_path(), None, True)
         self.frame_stack[-1].root_block = self.block
-        self.bud(self.block, nodes, 0, None)
+        yield self.bud(self.block, nodes, 0, None)
         self.frame_stack[-1].args = args or []
         self.block = old_block
+        self.slicer_stack.pop()
         return self.frame_stack.pop()
 
     def bud(self, parent, nodes, line, name, condition=None):
+        """
+        Generator visitor that splits nodes into blocks linked from parent, run it with run() or yield it from a visitor
+        :return: the last block that was added
+        """
         # iterate over all the nodes
         i = 0
         blocks_made = {None: 0, True: 0, False: 0}
@@ -50,7 +98,10 @@ class AlloyGenerator(NodeVisitor):
                 node = nodes[i]
                 i += 1
                 try:
-                    if self.visit(node):
+                    ended = self.visit(node)
+                    if isinstance(ended, types.GeneratorType):
+                        ended = yield ended
+                    if ended:
                         break
                 except UnsupportedNodeException:
                     msg = "The '{}' feature is not supported by MCAlloy".format(type(node).__name__)
@@ -69,8 +120,8 @@ class AlloyGenerator(NodeVisitor):
 
     def visit_Module(self, node):
         self.module = Module(self.mod_path, self.source_path)
-        module_code = compile(node, str(self.mod_path), "exec")
-        frame = self.resolve_frame(node.body, module_code, "__module__")
+        module_code = compile_deep(node, str(self.mod_path), self.doc)
+        frame = self.run(self.resolve_frame(node.body, module_code, "__module__"))
         self.module.frames.append(frame)
         return self.module
 
@@ -89,7 +140,7 @@ class AlloyGenerator(NodeVisitor):
         args = [arg.arg for arg in node.args.args]
         code = self.find_code(node)
         frame_name = "{}.{}".format(self.frame_path().frame, node.name)
-        frame = self.resolve_frame(node.body, code, frame_name, args)
+        frame = yield self.resolve_frame(node.body, code, frame_name, args)
 
         self.module.frames.append(frame)
         self.write(FunctionDef(node.lineno, frame_name, frame, self.get_fptr()), parent)
@@ -111,8 +162,8 @@ class AlloyGenerator(NodeVisitor):
         line = node.lineno
 
         pre = self.block
-        test_block = self.bud(pre, [node.test], line, "test")
-        while_block = self.bud(test_block, node.body, line, "while", True)
+        test_block = yield self.bud(pre, [node.test], line, "test")
+        while_block = yield self.bud(test_block, node.body, line, "while", True)
         while_block.links.append(Link(path=test_block.path))  # While always calls test when done
         return True
 
@@ -122,8 +173,8 @@ class AlloyGenerator(NodeVisitor):
         self.visit_eval(node.test)
 
         pre = self.block
-        self.bud(pre, node.body, line, "true", True)
-        self.bud(pre, node.orelse, line, "false", False)
+        yield self.bud(pre, node.body, line, "true", True)
+        yield self.bud(pre, node.orelse, line, "false", False)
         return True
 
     def visit_Expr(self, node):
@@ -133,15 +184,45 @@ class AlloyGenerator(NodeVisitor):
             self.visit_exec(node)
 
     def visit_exec(self, node):
+        slicer = self.slicer_stack[-1]
+        byte_code = slicer and slicer.exec_slice(node)
+        if byte_code is not None:
+            self.write(Byte(node.lineno, slicer.code, byte_code))
+            return
+
         code = compile(ast.Module(body=[node]), "", "exec")
         byte_code = list(Bytecode(code))[:-2]
+        if slicer is not None:
+            byte_code = self.frame_consts(byte_code)
         self.write(Byte(node.lineno, code, byte_code))
 
     def visit_eval(self, node):
+        slicer = self.slicer_stack[-1]
+        byte_code = slicer and slicer.eval_slice(node)
+        if byte_code is not None:
+            self.write(Byte(node.lineno, slicer.code, byte_code))
+            return
+
         code = compile(ast.Expression(body=node, lineno=node.lineno, col_offset=node.col_offset), "", "eval")
         byte_code = list(Bytecode(code))[:-1]
+        if slicer is not None:
+            byte_code = self.frame_consts(byte_code)
         self.write(Byte(node.lineno, code, byte_code))
 
+    def frame_consts(self, byte_code):
+        """
+        A statement compiled on its own has constants of its own. When the rest of the frame is sliced, point its
+        LOAD_CONSTs at the same constants in the frame's code object, which are the ones its frame is started with.
+        Constants are matched by type and repr, since 0.0 == -0.0
+        """
+        consts = self.frame_stack[-1].code.co_consts
+        index = {}
+        for i, const in enumerate(consts):
+            index.setdefault((type(const), repr(const)), i)
+
+        return [instr._replace(arg=index.get((type(instr.argval), repr(instr.argval)), instr.arg))
+                if instr.opname == "LOAD_CONST" else instr for instr in byte_code]
+
     def get_fptr(self):
         v = self.fptr_count
         self.fptr_count += 1
@@ -227,6 +308,34 @@ class AlloyGenerator(NodeVisitor):
     visit_Ellipsis = unsupported  # Didn't know it existed before starting this project, doesnt seem particularly useful
 
 
+def compile_deep(node, filename, doc):
+    """
+    compile() refuses trees nested deeper than the recursion limit, which long elif chains easily are. It only runs C
+    code, so the limit is raised by the depth of the tree while it compiles. The C stack still runs out, around 40000
+    levels on an 8MB stack, so trees deeper than MAX_DEPTH are reported instead
+    """
+    depth = 0
+    deepest = node  # Deepest node with a line, to point the error at
+    work = [(node, 1)]
+    while work:
+        n, d = work.pop()
+        if d > depth and hasattr(n, "lineno"):
+            deepest = n
+        depth = max(depth, d)
+        work.extend((child, d + 1) for child in ast.iter_child_nodes(n))
+
+    if depth > MAX_DEPTH:
+        error.ast_error(deepest, doc, "Nested {} levels deep, more than the {} that can be compiled".format(
+            depth, MAX_DEPTH))
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(limit + depth)
+    try:
+        return compile(node, filename, "exec")
+    finally:
+        sys.setrecursionlimit(limit)
+
+
 class UnsupportedNodeException(Exception):
     def __init__(self, node):
         self.node = node
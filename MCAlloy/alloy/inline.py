@@ -0,0 +1,359 @@
+import ast
+import copy
+import re
+from collections import Counter
+
+# Calls of inlined functions can be inlined too once their own calls are, this many times over
+ROUNDS = 4
+
+# Statements an inlined function's body can be made of, anything else has to run in a frame of its own
+STATEMENTS = (ast.Assign, ast.AugAssign, ast.Expr, ast.Pass, ast.If, ast.While)
+
+# Names read or written by direct commands
+NAMES = re.compile(r"Names\.(\w+)")
+
+
+def inline_module(tree: ast.Module, max_size: int) -> ast.Module:
+    inliner = Inliner(tree, max_size)
+    inliner.inline()
+    return tree
+
+
+class Callee:
+    def __init__(self, node: ast.FunctionDef, body: list, result):
+        """
+        A module level function that can be inlined
+        :param body: statements of the function, without its docstring and the return that ends it
+        :param result: expression the function returns, or None if it returns nothing
+        """
+        self.name = node.name
+        self.params = [arg.arg for arg in node.args.args]
+        self.body = body
+        self.result = result
+
+        # Parameters that the body assigns or direct commands use by name, which have to be bound to names of their
+        # own instead of being replaced by the arguments they are called with
+        self.bound = stored_names(body) | direct_names(body)
+
+    def uses(self, param: str) -> int:
+        """
+        How many times the result loads param
+        """
+        return sum(1 for n in ast.walk(self.result) if isinstance(n, ast.Name) and n.id == param)
+
+
+class Inliner:
+    def __init__(self, tree: ast.Module, max_size: int):
+        """
+        Replaces calls of small module level functions without direct commands, and of ones decorated with @embed, with
+        the body of the function so no frame has to be made for them. The parameters and locals of the function get
+        names of their own at every call, and they are the only names it can load. A call that is a whole statement,
+        like x = f(a), is replaced by statements binding the arguments followed by the body. Functions that only return
+        an expression of their parameters are also inlined inside other expressions. Everything inlined takes the line
+        of the call
+        :param max_size: largest function inlined without @embed, in nodes of its body
+        """
+        self.tree = tree
+        self.max_size = max_size
+        self.count = 0  # Calls inlined, also numbers the names given to the locals of each one
+
+    def inline(self):
+        for _ in range(ROUNDS):
+            callees = self.callees()
+            inlined = self.count
+            for body, bound in self.bodies():
+                self.inline_body(body, callees, bound)
+            if self.count == inlined:
+                break
+
+    def callees(self) -> dict:
+        """
+        Module level functions that can be inlined, by name. Each has to be the only thing bound to its name
+        """
+        bound = scope_names(self.tree.body)
+        callees = {}
+        for node in self.tree.body:
+            if isinstance(node, ast.FunctionDef) and bound[node.name] == 1:
+                callee = self.callee(node)
+                if callee is not None:
+                    callees[node.name] = callee
+        return callees
+
+    def callee(self, node: ast.FunctionDef):
+        """
+        :return: the Callee of a function, or None if it can't be inlined
+        """
+        args = node.args
+        if args.vararg or args.kwarg or args.kwonlyargs or args.defaults:
+            return None
+
+        embed = bool(node.decorator_list)
+        for decorator in node.decorator_list:
+            if not (isinstance(decorator, ast.Name) and decorator.id == "embed"):
+                return None
+
+        # Direct commands can do anything to the frame they run in, only functions marked @embed expect their caller's
+        size = sum(1 for stmt in node.body for _ in ast.walk(stmt))
+        direct = any(isinstance(n, ast.Expr) and is_direct(n) for stmt in node.body for n in ast.walk(stmt))
+        if not embed and (size > self.max_size or direct):
+            return None
+
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Str) and \
+                not body[0].value.s.startswith("/"):
+            body = body[1:]
+
+        result = None
+        if body and isinstance(body[-1], ast.Return):
+            result = body[-1].value
+            body = body[:-1]
+
+        # The body can only return at its end, and only load its own names
+        statements = [n for stmt in body for n in ast.walk(stmt) if isinstance(n, ast.stmt)]
+        if not all(isinstance(stmt, STATEMENTS) for stmt in statements):
+            return None
+
+        local = set(arg.arg for arg in args.args) | stored_names(body)
+        nodes = [n for stmt in body for n in ast.walk(stmt)] + (list(ast.walk(result)) if result else [])
+        if any(isinstance(n, ast.Name) and n.id not in local for n in nodes):
+            return None
+        if not direct_names(body) <= local:
+            return None
+
+        return Callee(node, body, result)
+
+    def bodies(self):
+        """
+        Every list of statements in the module, with the names bound in the function it is in, or None at module level
+        """
+        work = [(self.tree.body, None)]
+        while work:
+            body, bound = work.pop()
+            yield body, bound
+            for stmt in body:
+                if isinstance(stmt, ast.FunctionDef):
+                    names = scope_names(stmt.body)
+                    names.update(arg.arg for arg in stmt.args.args)
+                    work.append((stmt.body, names))
+                elif isinstance(stmt, (ast.If, ast.While)):
+                    work.append((stmt.body, bound))
+                    work.append((stmt.orelse, bound))
+
+    def inline_body(self, body: list, callees: dict, bound):
+        """
+        Inline the calls in a list of statements
+        :param bound: names bound in the function the statements are in, which hide module level functions
+        """
+        # Functions the statements can call, not hidden by one of their own names
+        callees = {name: callee for name, callee in callees.items() if not bound or name not in bound}
+        if not callees:
+            return
+
+        out = []
+        for stmt in body:
+            inlined = None
+            if isinstance(stmt, (ast.Expr, ast.Assign, ast.AugAssign, ast.Return)):
+                call = stmt.value
+                callee = self.called(call, callees)
+                if callee is not None and not self.substitutable(call, callee):
+                    inlined = self.inline_statement(stmt, call, callee)
+
+            if inlined is None:
+                self.inline_expressions(stmt, callees)
+                out.append(stmt)
+            else:
+                out += inlined
+
+        body[:] = out
+
+    @staticmethod
+    def called(call, callees: dict):
+        """
+        :return: the Callee that call calls, if it can be inlined
+        """
+        if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name) or call.keywords:
+            return None
+
+        callee = callees.get(call.func.id)
+        if callee is None or len(call.args) != len(callee.params):
+            return None
+        if any(isinstance(arg, ast.Starred) for arg in call.args):
+            return None
+        return callee
+
+    @staticmethod
+    def substitutable(call: ast.Call, callee: Callee) -> bool:
+        """
+        If the call can be replaced by the expression the callee returns, with its parameters replaced by the arguments.
+        The arguments can't call anything, so it doesn't matter when they are evaluated, and ones that aren't a name
+        or a constant can only be used once
+        """
+        if callee.body or callee.result is None:
+            return False
+
+        for param, arg in zip(callee.params, call.args):
+            if any(isinstance(n, ast.Call) for n in ast.walk(arg)):
+                return False
+            if not is_atomic(arg) and callee.uses(param) > 1:
+                return False
+        return True
+
+    def inline_statement(self, stmt: ast.stmt, call: ast.Call, callee: Callee):
+        """
+        :return: the statements to replace stmt with, or None if it can't be inlined
+        """
+        result = callee.result
+        if result is None and isinstance(stmt, ast.AugAssign):
+            return None
+
+        self.count += 1
+        names = {}
+        exprs = {}
+        out = []
+
+        # Bind the arguments in order, arguments that are names or constants are used in place if nothing changes them
+        for param, arg in zip(callee.params, call.args):
+            if is_atomic(arg) and param not in callee.bound:
+                exprs[param] = arg
+            else:
+                names[param] = "__{}{}_{}".format(callee.name, self.count, param)
+                out.append(ast.Assign(targets=[ast.Name(id=names[param], ctx=ast.Store())], value=arg))
+
+        for name in stored_names(callee.body):
+            names.setdefault(name, "__{}{}_{}".format(callee.name, self.count, name))
+
+        holder = ast.Module(body=copy.deepcopy(callee.body) + [ast.Expr(value=copy.deepcopy(result))])
+        replace_names(holder, names, exprs)
+        out += holder.body[:-1]
+        result = holder.body[-1].value if result is not None else ast.NameConstant(value=None)
+
+        if isinstance(stmt, ast.Expr):
+            # What is returned is thrown away, it only has to be evaluated if it calls something
+            if any(isinstance(n, ast.Call) for n in ast.walk(result)):
+                out.append(ast.Expr(value=result))
+        elif isinstance(stmt, ast.Assign):
+            out.append(ast.Assign(targets=stmt.targets, value=result))
+        elif isinstance(stmt, ast.AugAssign):
+            out.append(ast.AugAssign(target=stmt.target, op=stmt.op, value=result))
+        else:
+            out.append(ast.Return(value=result))
+
+        out = out or [ast.Pass()]
+        for node in out:
+            relocate(node, stmt)
+        return out
+
+    def inline_expressions(self, stmt: ast.stmt, callees: dict):
+        """
+        Replace the calls in the expressions of stmt that can be substituted by what the callee returns
+        """
+        # Children before their parents, so calls in the arguments of a call are inlined first. Walked without
+        # recursion, and without going into the bodies of the statement
+        order = []
+        work = [value for field, value in ast.iter_fields(stmt) if field not in ("body", "orelse")]
+        while work:
+            n = work.pop()
+            if isinstance(n, list):
+                work.extend(n)
+            elif isinstance(n, ast.AST):
+                order.append(n)
+                work.extend(ast.iter_child_nodes(n))
+
+        for n in reversed([stmt] + order):
+            for field, value in ast.iter_fields(n):
+                if n is stmt and field in ("body", "orelse"):
+                    continue
+                if isinstance(value, list):
+                    value[:] = [self.inline_expression(v, callees) for v in value]
+                else:
+                    setattr(n, field, self.inline_expression(value, callees))
+
+    def inline_expression(self, node, callees: dict):
+        callee = self.called(node, callees)
+        if callee is None or not self.substitutable(node, callee):
+            return node
+
+        self.count += 1
+        holder = ast.Expr(value=copy.deepcopy(callee.result))
+        replace_names(holder, {}, dict(zip(callee.params, node.args)))
+        return relocate(holder.value, node)
+
+
+def is_atomic(node) -> bool:
+    """
+    If node is a name or a number, which can be used in place of a parameter as many times as it is used. Strings
+    aren't, a string statement starting with / is a direct command
+    """
+    return isinstance(node, (ast.Name, ast.Num, ast.NameConstant))
+
+
+def stored_names(body: list) -> set:
+    """
+    Every name assigned in a list of statements
+    """
+    nodes = (n for stmt in body for n in ast.walk(stmt))
+    return {n.id for n in nodes if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load)}
+
+
+def direct_names(body: list) -> set:
+    """
+    Every name direct commands in a list of statements use
+    """
+    names = set()
+    for stmt in body:
+        for n in ast.walk(stmt):
+            if isinstance(n, ast.Expr) and is_direct(n):
+                names.update(NAMES.findall(n.value.s))
+    return names
+
+
+def is_direct(stmt: ast.Expr) -> bool:
+    return isinstance(stmt.value, ast.Str) and stmt.value.s.startswith("/")
+
+
+def scope_names(body: list) -> Counter:
+    """
+    How many times each name is bound by a list of statements, not counting the bodies of functions defined in them
+    """
+    names = Counter()
+    work = list(body)
+    while work:
+        n = work.pop()
+        if isinstance(n, (ast.FunctionDef, ast.ClassDef)):
+            names[n.name] += 1
+            work.extend(n.decorator_list)
+            continue
+        if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+            names[n.id] += 1
+        work.extend(ast.iter_child_nodes(n))
+    return names
+
+
+def replace_names(root: ast.AST, names: dict, exprs: dict):
+    """
+    Rename the names in names, and replace the loads of the names in exprs by a copy of their expression. The root
+    itself isn't replaced, so wrap a lone expression in something
+    """
+    for n in list(ast.walk(root)):
+        if isinstance(n, ast.Name) and n.id in names:
+            n.id = names[n.id]
+        elif isinstance(n, ast.Expr) and is_direct(n):
+            n.value.s = NAMES.sub(lambda m: "Names." + names.get(m.group(1), m.group(1)), n.value.s)
+
+        for field, value in ast.iter_fields(n):
+            if isinstance(value, ast.Name) and value.id in exprs and isinstance(value.ctx, ast.Load):
+                setattr(n, field, copy.deepcopy(exprs[value.id]))
+            elif isinstance(value, list):
+                value[:] = [copy.deepcopy(exprs[v.id]) if isinstance(v, ast.Name) and v.id in exprs and
+                            isinstance(v.ctx, ast.Load) else v for v in value]
+
+
+def relocate(node: ast.AST, at: ast.AST) -> ast.AST:
+    """
+    Move node and everything in it to the position of at, so inlined code belongs to the line it was inlined on
+    """
+    for n in ast.walk(node):
+        if "lineno" in n._attributes:
+            n.lineno = at.lineno
+            n.col_offset = at.col_offset
+    return node
@@ -8,6 +8,8 @@ def indent(s, amt=2):
 
 
 class AlloyNode:
+    __slots__ = ("line",)
+
     def __init__(self, line):
         self.line = line
 
@@ -16,6 +18,8 @@ class AlloyNode:
 
 
 class Link(AlloyNode):
+    __slots__ = ("block", "path", "condition")
+
     def __init__(self, block=None, path=None, condition=None):
         super().__init__(None)
         self.block = block
@@ -32,6 +36,8 @@ class Link(AlloyNode):
 
 
 class Block(AlloyNode):
+    __slots__ = ("is_root", "links", "body", "path")
+
     def __init__(self, frame_path, name, is_root=False):
         super().__init__(None)
         self.is_root = is_root
@@ -50,6 +56,8 @@ class Block(AlloyNode):
 
 
 class Frame(AlloyNode):
+    __slots__ = ("root_block", "tail_block", "path", "code", "args")
+
     def __init__(self, mod_path, name, code):
         super().__init__(None)
         self.root_block = None
@@ -63,6 +71,8 @@ class Frame(AlloyNode):
 
 
 class Module(AlloyNode):
+    __slots__ = ("frames", "path", "source_path")
+
     def __init__(self, path, source_path):
         super().__init__(None)
         self.frames = []
@@ -74,6 +84,8 @@ class Module(AlloyNode):
 
 
 class Direct(AlloyNode):
+    __slots__ = ("command",)
+
     def __init__(self, line, command):
         super().__init__(line)
         self.command = command
@@ -83,6 +95,8 @@ class Direct(AlloyNode):
 
 
 class FunctionDef(AlloyNode):
+    __slots__ = ("name", "args", "frame", "fptr")
+
     def __init__(self, line, name, frame, fptr):
         super().__init__(line)
         self.name = name
@@ -98,6 +112,8 @@ class FunctionDef(AlloyNode):
 
 
 class ClassDef(AlloyNode):
+    __slots__ = ("name", "frame", "fptr")
+
     def __init__(self, line, name, frame, class_fptr):
         super().__init__(line)
         self.name = name
@@ -112,6 +128,8 @@ class ClassDef(AlloyNode):
 
 
 class Return(AlloyNode):
+    __slots__ = ()
+
     def __init__(self, line):
         super().__init__(line)
 
@@ -122,6 +140,8 @@ class Return(AlloyNode):
 
 
 class If(AlloyNode):
+    __slots__ = ("true_path", "false_path", "cont_path")
+
     def __init__(self, line, true_path, false_path, cont_path):
         super().__init__(line)
         self.true_path = true_path
@@ -138,6 +158,8 @@ class If(AlloyNode):
 
 
 class While(AlloyNode):
+    __slots__ = ("test_path", "while_path", "cont_path")
+
     def __init__(self, line, test_path, while_path, cont_path):
         super().__init__(line)
         self.test_path = test_path
@@ -154,6 +176,8 @@ class While(AlloyNode):
 
 
 class Byte(AlloyNode):
+    __slots__ = ("code", "bytecode")
+
     def __init__(self, line, code, bytecode):
         super().__init__(line)
         self.code = code
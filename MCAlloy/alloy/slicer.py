@@ -0,0 +1,133 @@
+import ast
+from dis import get_instructions
+
+# Instructions CPython adds around a statement to implement the control flow of the statement containing it.
+# The Alloy implements that flow with blocks instead, so they are dropped from the ends of a slice
+LEADING = {"SETUP_LOOP"}
+TRAILING = {"JUMP_ABSOLUTE", "JUMP_FORWARD", "POP_BLOCK"}
+TESTS = {"POP_JUMP_IF_FALSE", "POP_JUMP_IF_TRUE"}
+
+# A slice still holding one of these after trimming has flow the Alloy can't represent
+FLOW = LEADING | TRAILING | TESTS | {"RETURN_VALUE", "JUMP_IF_FALSE_OR_POP", "JUMP_IF_TRUE_OR_POP",
+                                     "SETUP_EXCEPT", "SETUP_FINALLY", "SETUP_WITH", "FOR_ITER", "BREAK_LOOP",
+                                     "CONTINUE_LOOP", "END_FINALLY", "YIELD_VALUE", "YIELD_FROM"}
+
+
+class CodeSlicer:
+    def __init__(self, code, body):
+        """
+        Splits the instructions of a frame's code object into the statements that compiled to them, so each
+        statement's bytecode is taken from the code CPython actually built instead of compiling it again
+        :param code: code object of the frame
+        :param body: statements of the frame
+        """
+        self.code = code
+        self.slices = {}
+        self.owners = {}
+        self.ambiguous = set()
+
+        line_owners = {}
+        for stmt in self.statements(body):
+            self.slices[stmt] = []
+            for line in self.lines(stmt):
+                owner = line_owners.setdefault(line, stmt)
+                if owner is not stmt:
+                    # Statements sharing a line can't be told apart by the line table
+                    self.ambiguous.update([owner, stmt])
+
+        owner = None
+        for instr in get_instructions(code):
+            if instr.starts_line is not None:
+                owner = line_owners.get(instr.starts_line, owner)
+            if owner is not None:
+                self.slices[owner].append(instr)
+
+        if owner is not None and not isinstance(owner, ast.Return) and self.is_implicit_return(self.slices[owner]):
+            self.slices[owner] = self.slices[owner][:-2]
+
+    def statements(self, body):
+        """
+        Every statement that compiles into this frame's code, the bodies of nested functions and classes have their own
+        """
+        # A stack of statement lists instead of recursion, so deeply nested statements don't hit the recursion limit
+        stack = [iter(body)]
+        while stack:
+            stmt = next(stack[-1], None)
+            if stmt is None:
+                stack.pop()
+                continue
+
+            yield stmt
+            if isinstance(stmt, ast.If) or isinstance(stmt, ast.While):
+                self.owners[stmt.test] = stmt
+            elif isinstance(stmt, ast.Return) and stmt.value is not None:
+                self.owners[stmt.value] = stmt
+
+            if not isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                bodies = [getattr(stmt, field, []) for field in ["body", "orelse", "finalbody"]]
+                bodies.extend(handler.body for handler in getattr(stmt, "handlers", []))
+                # Reversed, so the bodies are walked in order
+                stack.extend(iter(b) for b in reversed(bodies))
+
+    @staticmethod
+    def lines(stmt):
+        lines = {stmt.lineno}
+        for field, value in ast.iter_fields(stmt):
+            if field in ["body", "orelse", "finalbody", "handlers"]:
+                continue
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, ast.AST):
+                    lines.update(n.lineno for n in ast.walk(item) if hasattr(n, "lineno"))
+        return lines
+
+    @staticmethod
+    def is_implicit_return(instrs):
+        """
+        CPython ends a frame with 'return None', which ends up in the slice of whichever statement is last
+        """
+        return len(instrs) >= 2 and \
+            instrs[-1].opname == "RETURN_VALUE" and \
+            instrs[-2].opname == "LOAD_CONST" and instrs[-2].argval is None
+
+    def exec_slice(self, stmt):
+        """
+        Bytecode of a simple statement, or None if it can't be sliced out of the frame's code
+        """
+        if stmt not in self.slices or stmt in self.ambiguous:
+            return None
+
+        instrs = self.slices[stmt]
+        while instrs and instrs[-1].opname in TRAILING:
+            instrs = instrs[:-1]
+
+        return self.checked(instrs)
+
+    def eval_slice(self, node):
+        """
+        Bytecode of the expression tested by an If or While, or returned by a Return, without the jump or return
+        CPython wraps it in. None if it can't be sliced out of the frame's code
+        """
+        stmt = self.owners.get(node)
+        if stmt is None or stmt in self.ambiguous:
+            return None
+
+        instrs = self.slices[stmt]
+        if instrs and instrs[0].opname in LEADING:
+            instrs = instrs[1:]
+
+        end = {"RETURN_VALUE"} if isinstance(stmt, ast.Return) else TESTS
+        if instrs and instrs[-1].opname in end:
+            instrs = instrs[:-1]
+
+        # Constant tests like 'while True' are optimized out by CPython, and have nothing to slice
+        if not instrs:
+            return None
+
+        return self.checked(instrs)
+
+    @staticmethod
+    def checked(instrs):
+        if any(instr.opname in FLOW for instr in instrs):
+            return None
+        # dis already folds EXTENDED_ARG into the argument of the instruction after it
+        return [instr for instr in instrs if instr.opname != "EXTENDED_ARG"]
@@ -1,21 +1,36 @@
 from instrs import *
 from containers import ILBlock, ILFrame, ILModule
 from alloy import nodes
-from vm import ConstIndex
+from assembler.scores import int_locals
+from vm import ConstIndex, ScoreIndex
 
 
-def assemble_alloy(doc: str, alloy: nodes.AlloyNode):
-    asm = AlloyAssembler(doc, alloy)
+def assemble_alloy(doc: str, alloy: nodes.AlloyNode, source_map=False, scores=False, pool=0, passenger=False):
+    asm = AlloyAssembler(doc, alloy, source_map, scores, pool, passenger)
     return asm.assemble()
 
 
 class AlloyAssembler:
-    def __init__(self, doc: str, alloy: nodes.AlloyNode):
+    def __init__(self, doc: str, alloy: nodes.AlloyNode, source_map=False, scores=False, pool=0, passenger=False):
+        """
+        :param source_map: mark the source line and bytecode offset each instruction was assembled from
+        :param scores: keep the int locals of each frame in scores on the frame's entity instead of its Names NBT
+        :param pool: most released frame entities kept for calls to reuse, 0 summons and kills one for every call
+        :param passenger: mount the frame of each call on its caller and reach it as a passenger
+        """
         self.alloy = alloy
         self.doc = doc
+        self.lines = doc.split("\n")  # Split once, every node with a line looks its line up
+        self.source_map = source_map
+        self.scores = scores
+        self.pool = pool
+        self.passenger = passenger
         self.module = None
         self.frame = None
         self.block = None
+        self.score_locals = {}  # Score of each int local in the frame being assembled, by name
+        # Tags are written around every block, one Comment is shared by all the tags of the module with the same text
+        self.comment_tags = {}
 
     def assemble(self):
         self.visit(self.alloy)
@@ -23,10 +38,10 @@ class AlloyAssembler:
 
     def visit(self, node: nodes.AlloyNode):
         if node.line is not None:
-            s = "{}: {}".format(node.line, self.doc.split("\n")[node.line - 1])
+            s = "{}: {}".format(node.line, self.lines[node.line - 1])
             # print(s)
             if self.block:
-                self.write(Comment(" " + s))
+                self.write(Comment(" " + s, node.line))
 
         visitor = getattr(self, "assemble_" + type(node).__name__.lower())
         visitor(node)
@@ -38,29 +53,48 @@ class AlloyAssembler:
     def assemble_frame(self, node: nodes.Frame):
         self.frame = ILFrame(node.path, node.code)
         self.module.frames.append(self.frame)
+        if self.scores:
+            self.score_locals = {name: ScoreIndex(i) for i, name in enumerate(int_locals(node))}
+
         self.visit(node.root_block)
         self.frame = None
+        self.score_locals = {}
 
     def assemble_block(self, node: nodes.Block):
         parent = self.block
-        self.block = ILBlock(node.path)
-
-        # Assemble body
-        with CommentTags(self, "body"):
-            [self.visit(n) for n in node.body]
-
-        # Add and assemble links
-        with CommentTags(self, "links"):
-            for link in node.links:
-                tag = {None: "Bridge", True: "Bridge if true", False: "Bridge if false"}[link.condition]
-                tag += ": " + str(link.path)
-                self.visit(link)
+        indent = CommentTags.indent
+
+        # Blocks linked from this one are assembled from a worklist instead of recursively, so deeply nested blocks
+        # don't hit the recursion limit. Each keeps the IL block it is a target of, and how deep its tags are indented
+        work = [(node, parent, indent)]
+        while work:
+            node, target_of, depth = work.pop()
+            self.block = ILBlock(node.path)
+            CommentTags.indent = depth
+
+            # Assemble body
+            with CommentTags(self, "body"):
+                [self.visit(n) for n in node.body]
+
+            # Add and assemble links
+            linked = []
+            with CommentTags(self, "links"):
+                for link in node.links:
+                    tag = {None: "Bridge", True: "Bridge if true", False: "Bridge if false"}[link.condition]
+                    tag += ": " + str(link.path)
+                    self.visit(link)
+                    if link.block:
+                        linked.append(link.block)
+
+            if node.is_root:
+                self.wrap_root_block()
+            else:
+                target_of.targets.append(self.block)
 
-        if node.is_root:
-            self.wrap_root_block()
-        else:
-            parent.targets.append(self.block)
+            # Reversed, so linked blocks are popped and assembled in order
+            work.extend((b, self.block, depth + 1) for b in reversed(linked))
 
+        CommentTags.indent = indent
         self.block = parent
 
     def wrap_root_block(self):
@@ -73,29 +107,34 @@ class AlloyAssembler:
         self.write(Return(None))
 
     def assemble_link(self, node: nodes.Link):
+        # The linked block is assembled by assemble_block
         self.write({
             None: BlockBridge(node.path),
             True: CallBlockIf(node.path),
             False: CallBlockIf(node.path, True)
         }[node.condition])
 
-        if node.block:
-            parent = self.block
-            self.visit(node.block)
-            self.block = parent
-
     def assemble_byte(self, node: nodes.Byte):
         write = self.write
+        line = node.line
 
         for instr in node.bytecode:
             op = instr.opname
+
+            if self.source_map:
+                line = instr.starts_line or line
+                write(Mark(line, instr.offset))
+
             if op == "LOAD_CONST":
                 ci = ConstIndex(instr.arg)
                 write(Load(ci))
 
-            elif op in ["LOAD_NAME", "LOAD_FAST"]:
-                sym = NameIndex(instr.argrepr)
-                write(Load(sym))
+            elif op in ["LOAD_NAME", "LOAD_FAST", "LOAD_GLOBAL"]:
+                if instr.argval in self.score_locals:
+                    write(LoadScore(self.score_locals[instr.argval]))
+                else:
+                    sym = NameIndex(instr.argrepr)
+                    write(Load(sym))
 
             elif op.startswith("BINARY_") or op.startswith("INPLACE_"):
                 write(BinaryOp(binops[op.split("_", 1)[1]]))
@@ -107,14 +146,17 @@ class AlloyAssembler:
                 self.call_function(instr.arg)
 
             elif op == "RETURN_VALUE":
-                write(Return())
+                write(RETURN_TOS)
 
             elif op == "POP_TOP":
-                write(Seek(-1))
+                write(POP)
 
-            elif op == "STORE_NAME":
-                ni = NameIndex(instr.argval)
-                write(Store(ni))
+            elif op in ["STORE_NAME", "STORE_FAST", "STORE_GLOBAL"]:
+                if instr.argval in self.score_locals:
+                    write(StoreScore(self.score_locals[instr.argval]))
+                else:
+                    ni = NameIndex(instr.argval)
+                    write(Store(ni))
 
             elif op == "LOAD_ATTR":
                 ni = NameIndex(instr.argval)
@@ -141,7 +183,8 @@ class AlloyAssembler:
 
     def assemble_functiondef(self, node: nodes.FunctionDef):
         self.write(LoadNBT('{{f:{},t:"fptr"}}'.format(node.fptr)))
-        self.write(Store(node.name))
+        # node.name is the path of the function's frame, the function is bound to the last part of it
+        self.write(Store(NameIndex(node.name.rsplit(".", 1)[-1])))
 
     def assemble_classdef(self, node: nodes.ClassDef):
         self.write(LoadNBT('{{f:{},t:"fptr"}}'.format(node.fptr)))
@@ -149,28 +192,38 @@ class AlloyAssembler:
         self.write(Store(NameIndex(node.name)))
 
     def assemble_return(self, node):
-        self.write(Return())
+        self.write(RETURN_TOS)
         return True
 
     def assemble_if(self, node: nodes.If):
         # test result should be TOS
         self.write(CallBlockIf(node.true_path))
         self.write(CallBlockIf(node.false_path, True))
-        self.write(Seek(-1))
+        self.write(POP)
         return True
 
     def assemble_while(self, node: nodes.While):
         self.write(CallBlockIf(node.while_path))
-        self.write(Seek(-1))
+        self.write(POP)
         return True
 
     def assemble_direct(self, node: nodes.Direct):
         self.write(Direct(node.command))
 
     def call_function(self, arg_count):
-        self.write(InitContext(arg_count))
-        self.write(CallFuncPointer())
-        self.write(EndCall())
+        if self.passenger:
+            self.write(InitContext(arg_count, mounted=True))
+            self.write(CALL_PASSENGER)
+            self.write(EndCall(self.scores, mounted=True))
+            return
+
+        self.write(InitContext(arg_count, self.pool > 0))
+        self.write(CALL_FUNC_POINTER)
+        # Scores outlive the entities they are on, so a callee that kept locals in them has them reset
+        if self.pool:
+            self.write(EndCall(self.scores, self.pool))
+        else:
+            self.write(END_CALL_SCORES if self.scores else END_CALL)
 
     def write(self, command: BaseInstr):
         self.block.push(command)
@@ -184,7 +237,7 @@ class AlloyAssembler:
         else:
             msg = "\n"
             pre = "[{}] ".format(node.line if hasattr(node, "line") else "?")
-            msg += "{}{}\n".format(pre, self.doc.split("\n")[node.line - 1])
+            msg += "{}{}\n".format(pre, self.lines[node.line - 1])
             msg += detail
             return msg
 
@@ -208,7 +261,10 @@ class CommentTags:
 
     def tag(self, start):
         s = "{}<{}{} >".format(self.line_label, " " if start else "/", self.text)
-        self.ilbg.write(Comment(s))
+        shared = self.ilbg.comment_tags
+        if s not in shared:
+            shared[s] = Comment(s)
+        self.ilbg.write(shared[s])
         # print(s)
 
 
@@ -1,23 +1,93 @@
+import contextlib
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
+from assembler.module import assemble_module
 from assembler.namespace import ILNamespaceGenerator
 from containers import ILNamespace, Path
 
 
 class ILDatapackGenerator:
-    def __init__(self, folder_path: str):
+    def __init__(self, folder_path: str, gs, cache=None, executor=None):
+        """
+        :param executor: process pool to assemble modules on when there is more than one job, one is made for the
+        build if not given
+        """
         self.folder_path = folder_path
+        self.gs = gs
+        self.cache = cache
+        self.executor = executor
         self.name = os.path.basename(os.path.normpath(self.folder_path))
 
-    def assemble(self) -> List[ILNamespace]:
-        namespaces = []
-        for namespace in os.listdir(self.folder_path):
+    def namespace_gens(self) -> List[ILNamespaceGenerator]:
+        namespace_gens = []
+        for namespace in sorted(os.listdir(self.folder_path)):
             ns_path = os.path.join(self.folder_path, namespace)
             path = Path(namespace=namespace)
 
-            il_namespace_gen = ILNamespaceGenerator(path, ns_path)
-            ns = il_namespace_gen.assemble()
-            namespaces.append(ns)
+            namespace_gens.append(ILNamespaceGenerator(path, ns_path, self.gs, self.cache))
+
+        return namespace_gens
+
+    def assemble(self) -> List[ILNamespace]:
+        namespace_gens = self.namespace_gens()
+
+        if self.gs.jobs > 1:
+            return self.assemble_parallel(namespace_gens)
+
+        return [gen.assemble() for gen in namespace_gens]
+
+    def assemble_parallel(self, namespace_gens: List[ILNamespaceGenerator]) -> List[ILNamespace]:
+        """
+        Assemble every module on a pool of worker processes. Modules are pushed in the order they were submitted,
+        not the order they finish, so the output is identical to a serial build
+        """
+        with self.pool() as executor:
+            futures = [[executor.submit(assemble_module, *args) for args in gen.module_args()]
+                       for gen in namespace_gens]
+
+            for gen, module_futures in zip(namespace_gens, futures):
+                for future in module_futures:
+                    gen.namespace.push(future.result())
+
+        return [gen.namespace for gen in namespace_gens]
+
+    def stream(self, namespace_gens: List[ILNamespaceGenerator]):
+        """
+        Assemble modules one at a time as they are asked for, without keeping them in their namespaces, so only the
+        modules still being used are in memory. With more than one job, a few modules are assembled ahead
+        """
+        args = (args for gen in namespace_gens for args in gen.module_args())
+
+        if self.gs.jobs <= 1:
+            for module_args in args:
+                yield assemble_module(*module_args)
+            return
+
+        with self.pool() as executor:
+            pending = deque()
+            for module_args in args:
+                pending.append(executor.submit(assemble_module, *module_args))
+                if len(pending) >= self.gs.jobs * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def pool(self):
+        """
+        Context giving the process pool to assemble on. A pool that was given is left running when it exits
+        """
+        if self.executor is not None:
+            return left_running(self.executor)
+        return ProcessPoolExecutor(self.gs.jobs)
+
 
-        return namespaces
+@contextlib.contextmanager
+def left_running(executor):
+    """
+    Context giving executor without shutting it down when it exits, like contextlib.nullcontext from Python 3.7
+    """
+    yield executor
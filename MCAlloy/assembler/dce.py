@@ -0,0 +1,170 @@
+import re
+
+from containers import ILModule, ILFrame, ILBlock
+from instrs import Comment, Mark, Direct, Load, LoadAttr, LoadNBT, Store, Return, BlockBridge, CallBlockIf
+from instrs import BLOCK_LINKS
+from vm import NameIndex
+
+
+def dce_module(module: ILModule) -> ILModule:
+    dce = DeadCode()
+    for frame in module.frames:
+        dce.prune_frame(frame)
+    dce.prune_frames(module)
+
+    module.removed["dce"] = dce.removed
+    return module
+
+
+class DeadCode:
+    def __init__(self):
+        """
+        Removes code that can never run, by following the links between blocks. Bridges and returns are skipped once
+        ret is set, so everything linked after a block that always returns is dropped. Blocks left without any
+        commands are dropped with the link to them, and so are frames of functions whose name is never loaded
+        """
+        self.removed = 0  # Commands removed, not counting comments
+
+    def prune_frame(self, frame: ILFrame):
+        looped = looped_paths(frame)
+        returns = set()  # Blocks that always set ret before they finish
+
+        # Every block after the blocks it targets, so they are pruned first and it knows if they return or are empty
+        for block in reversed(list(frame.blocks())):
+            if self.prune_block(block, returns, looped):
+                returns.add(block)
+
+    def prune_block(self, block: ILBlock, returns: set, looped: set) -> bool:
+        """
+        Remove the links in block that can't run or lead to empty blocks
+        :param returns: blocks that always return, block's targets have to be in it already if they do
+        :return: True if block always returns
+        """
+        targets = {target.path: target for target in block.targets}
+        dropped = set()
+        returned = False
+        branches = set()  # Conditions of the blocks called if TOS is true or false that always return
+
+        instrs = []
+        for instr in block.instrs:
+            t = type(instr)
+            target = targets.get(instr.path) if t in BLOCK_LINKS else None
+
+            # Bridges and returns after ret is set won't run, their effect on the stack has to be none to drop them
+            dead = returned and t in (BlockBridge, Return) and instr.stack_effect() == (0, 0)
+            # Links to blocks with nothing in them do nothing
+            dead = dead or target is not None and target.path not in looped and is_empty(target)
+
+            if dead:
+                self.removed += instr.size()
+                if target is not None:
+                    dropped.add(target)
+                continue
+
+            instrs.append(instr)
+
+            if t is Return:
+                returned = True
+            elif t is BlockBridge and target in returns:
+                returned = True
+            elif t is CallBlockIf and target in returns:
+                branches.add(instr.invert)
+                returned = returned or len(branches) == 2
+
+        block.instrs = instrs
+        if dropped:
+            block.targets = [target for target in block.targets if target not in dropped]
+            for target in dropped:
+                self.removed += sum(instr.size() for b in blocks_from(target) for instr in b.instrs)
+
+        return returned
+
+    def prune_frames(self, module: ILModule):
+        """
+        Remove the frames of functions whose name isn't loaded outside of them, and the commands that define them.
+        Names used in direct commands count as loaded
+        """
+        loads = {frame: loaded_names(frame) for frame in module.frames}
+
+        changed = True
+        while changed:
+            changed = False
+            for frame in list(module.frames):
+                path = frame.path.frame
+                if path is None or path == "__module__":
+                    continue
+
+                name = path.rsplit(".", 1)[-1]
+                word = re.compile(r"\b{}\b".format(re.escape(name)))
+                nested = path + "."
+                used = any(name in names or any(word.search(command) for command in names[None])
+                           for other, names in loads.items()
+                           if other is not frame and not (other.path.frame or "").startswith(nested))
+                if used:
+                    continue
+
+                module.frames.remove(frame)
+                del loads[frame]
+                self.removed += sum(instr.size() for block in frame.blocks() for instr in block.instrs)
+                for other in module.frames:
+                    self.remove_definition(other, path)
+                changed = True
+
+    def remove_definition(self, frame: ILFrame, path: str):
+        """
+        Remove the function pointer to the frame at path being loaded and stored under its name
+        """
+        for block in frame.blocks():
+            real = [n for n, instr in enumerate(block.instrs) if type(instr) not in (Comment, Mark)]
+            for a, b in zip(real, real[1:]):
+                load, store = block.instrs[a], block.instrs[b]
+                if type(load) is LoadNBT and type(store) is Store and store.args[0] == path:
+                    self.removed += load.size() + store.size()
+                    del block.instrs[b]
+                    del block.instrs[a]
+                    return
+
+
+def looped_paths(frame: ILFrame) -> set:
+    """
+    Paths of the blocks that links loop back to. Those links have no target block of their own, the block they call is
+    also linked from somewhere else, so it has to stay where it is
+    """
+    paths = set()
+    for block in frame.blocks():
+        targets = {target.path for target in block.targets}
+        links = (instr for instr in block.instrs if type(instr) in BLOCK_LINKS)
+        paths.update(instr.path for instr in links if instr.path not in targets)
+    return paths
+
+
+def is_empty(block: ILBlock) -> bool:
+    return not block.targets and all(type(instr) in (Comment, Mark) for instr in block.instrs)
+
+
+def blocks_from(block: ILBlock):
+    """
+    block and every block it links to
+    """
+    work = [block]
+    while work:
+        block = work.pop()
+        yield block
+        work.extend(block.targets)
+
+
+def loaded_names(frame: ILFrame) -> dict:
+    """
+    Every name loaded in the frame, with the text of its direct commands under None
+    """
+    names = {None: []}
+    for block in frame.blocks():
+        for instr in block.instrs:
+            t = type(instr)
+            if t is Load and isinstance(instr.args[1], NameIndex):
+                names[instr.args[1].index] = True
+            elif t is LoadAttr:
+                names[instr.name_index.index] = True
+            elif t is Direct:
+                names[None].append(instr.args[0])
+    return names
@@ -0,0 +1,88 @@
+from containers import ILModule, ILFrame, ILBlock
+from instrs import Return, BlockBridge, Seek, BLOCK_LINKS
+from assembler.dce import looped_paths, is_empty
+
+
+def merge_module(module: ILModule) -> ILModule:
+    merge = BlockMerger()
+    for frame in module.frames:
+        merge.merge_frame(frame)
+
+    module.removed["merge"] = merge.removed
+    return module
+
+
+class BlockMerger:
+    def __init__(self):
+        """
+        Moves the commands of bridged blocks into the block that bridges to them, so straight line code isn't split
+        over a chain of functions. A bridge only runs its block if ret isn't set, so a block is only merged where ret
+        can't be set yet: the block bridging to it was started with ret unset, and nothing before the bridge returns.
+        Blocks that are looped back to have more than one caller and stay where they are. Calls are taken to leave ret
+        the way they found it
+        """
+        self.removed = 0  # Commands removed, not counting comments
+
+    def merge_frame(self, frame: ILFrame):
+        looped = looped_paths(frame)
+
+        # Blocks that have a return in them or in a block they link to
+        returning = set()
+        for block in reversed(list(frame.blocks())):
+            if any(type(instr) is Return for instr in block.instrs) or any(t in returning for t in block.targets):
+                returning.add(block)
+
+        # Each block with whether ret is unset when it starts, the root block starts every call of the frame
+        work = [(frame.root_block, True)] if frame.root_block else []
+        while work:
+            block, clean = work.pop()
+            starts = self.merge_block(block, clean, looped, returning)
+
+            # Reversed, so targets are popped and merged in order
+            work.extend((target, starts[target]) for target in reversed(block.targets))
+
+    def merge_block(self, block: ILBlock, clean: bool, looped: set, returning: set) -> dict:
+        """
+        Move the blocks block bridges to into it, where ret can't be set
+        :param clean: if ret is unset when block starts
+        :param returning: blocks that have a return in them or a block they link to
+        :return: for each of block's targets, if ret is unset when it starts
+        """
+        targets = {target.path: target for target in block.targets}
+        starts = {}
+        may_return = not clean
+        kept = []
+
+        instrs = []
+        pending = list(reversed(block.instrs))  # Merged blocks have their instructions pushed here to be looked at next
+        while pending:
+            instr = pending.pop()
+            t = type(instr)
+
+            if t in BLOCK_LINKS:
+                target = targets.get(instr.path)
+                if target is not None and t is BlockBridge and target.path not in looped and \
+                        (not may_return or is_empty(target)):
+                    # Blocks leave what they don't pop on the stack, like the tests of if statements, and the block
+                    # bridging to them carries on from where it was. Seek back to there once they're done
+                    left = sum(pushes - pops for pops, pushes in (i.stack_effect() for i in target.instrs))
+                    if left:
+                        pending.append(Seek(-left))
+                    pending.extend(reversed(target.instrs))
+                    targets.update((b.path, b) for b in target.targets)
+                    self.removed += instr.size()
+                    continue
+
+                if target is not None:
+                    kept.append(target)
+                    starts[target] = t is BlockBridge or not may_return
+                    may_return = may_return or target in returning
+
+            elif t is Return:
+                may_return = True
+
+            instrs.append(instr)
+
+        block.instrs = instrs
+        block.targets = kept
+        return starts
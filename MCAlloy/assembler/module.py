@@ -1,42 +1,100 @@
 import ast
 
 import error
+from alloy.fold import fold_module
 from alloy.generator import AlloyGenerator
+from alloy.inline import inline_module
 from assembler.alloy_assembler import assemble_alloy
+from assembler.dce import dce_module
+from assembler.merge import merge_module
+from assembler.peephole import peephole_module
+from assembler.verifier import verify_module
 from instrs import InitContext, Call
 from containers import ILModule, ILFrame, ILBlock
+from passes import PassManager
 
 
-def assemble_module(path, file_path, name):
-    gen = ILModuleGenerator(path, file_path, name)
+def assemble_module(path, file_path, name, gs, cache=None):
+    gen = ILModuleGenerator(path, file_path, name, gs, cache)
     return gen.assemble()
 
 
 class ILModuleGenerator:
-    def __init__(self, path, file_path, name):
+    def __init__(self, path, file_path, name, gs, cache=None):
         self.file_path = file_path
+        self.gs = gs
+        self.cache = cache
         self.path = path.altered(module=name)
         self.module = ILModule(self.path, file_path)
         self.mod_path = self.path.altered(frame="__module__")
 
+        # Every stage of the module is kept, so a long running compiler can hold on to them
+        self.source_text = None
+        self.tree = None
+        self.alloy = None
+
     def assemble(self) -> ILModule:
         with open(self.file_path, "r") as f:
             source_text = f.read()
+        self.source_text = source_text
+
+        passes = PassManager(self.gs, str(self.path))
+
+        if self.cache is not None:
+            self.module.key = self.cache.key(source_text)
+            passes.run("cache", self.load_cached)
+            if self.module.files is not None:
+                self.module.profile = passes.records
+                return self.module
+
+        self.tree = passes.run("parse", self.parse)
+        if self.gs.inline:
+            self.tree = passes.run("inline", inline_module, self.tree, self.gs.inline_size)
+        if self.gs.fold:
+            self.tree = passes.run("fold", fold_module, self.tree)
+        self.alloy = passes.run("alloy", self.generate_alloy)
+        module = passes.run("assemble", self.assemble_il)
+        if self.gs.dce:
+            passes.run("dce", dce_module, module)
+        if self.gs.merge:
+            passes.run("merge", merge_module, module)
+        if self.gs.peephole:
+            passes.run("peephole", peephole_module, module)
+        passes.run("verify", verify_module, source_text, module)
+
+        module.key = self.module.key
+        module.profile = passes.records
+        self.module = module
 
+        return module
+
+    def load_cached(self) -> ILModule:
+        entry = self.cache.load(self.path, self.module.key)
+        if entry is not None:
+            self.module.files, self.module.source_map = entry
+        return self.module
+
+    def parse(self) -> ast.Module:
         # dis(source_text)
         try:
-            tree = ast.parse(source_text)
+            return ast.parse(self.source_text)
         except SyntaxError as e:
-            error.doc_error(e.lineno, source_text, e.msg)
+            error.doc_error(e.lineno, self.source_text, e.msg)
             raise  # Never reached, since doc_error calls quit()
 
-        gen = AlloyGenerator(self.mod_path, source_text, self.file_path)
-        alloy = gen.visit(tree)
+    def generate_alloy(self):
+        gen = AlloyGenerator(self.mod_path, self.source_text, self.file_path, self.gs)
+        alloy = gen.visit(self.tree)
         # alloy.pprint()
+        return alloy
 
-        module = assemble_alloy(source_text, alloy)
+    def assemble_il(self) -> ILModule:
+        module = assemble_alloy(self.source_text, self.alloy, self.gs.source_map, self.gs.scores, self.gs.pool,
+                                self.gs.passenger)
+        # The Alloy's path points at the module's __module__ frame. Its passes are profiled under the module's path,
+        # the same as when it comes from the cache
+        module.path = self.path
         module.push(self.launch_frame())
-
         return module
 
     def launch_frame(self):
@@ -6,19 +6,28 @@ from containers import Path
 
 
 class ILNamespaceGenerator:
-    def __init__(self, path: Path, folder_path: str):
+    def __init__(self, path: Path, folder_path: str, gs, cache=None):
         self.path = path
+        self.gs = gs
+        self.cache = cache
         self.folder_path = folder_path
         self.name = self.path.namespace
         self.namespace = ILNamespace(self.path)
 
     def assemble(self) -> ILNamespace:
-        for file in os.listdir(self.folder_path):
-            mod_name = os.path.splitext(os.path.basename(file))[0]
-            mod_file_path = os.path.join(self.folder_path, file)
-
-            mod_il = assemble_module(self.path, mod_file_path, mod_name)
+        for args in self.module_args():
+            mod_il = assemble_module(*args)
 
             self.namespace.push(mod_il)
 
         return self.namespace
+
+    def module_args(self):
+        """
+        Arguments to assemble_module for every module in this namespace, in the order they are pushed
+        """
+        for file in sorted(os.listdir(self.folder_path)):
+            mod_name = os.path.splitext(os.path.basename(file))[0]
+            mod_file_path = os.path.join(self.folder_path, file)
+
+            yield self.path, mod_file_path, mod_name, self.gs, self.cache
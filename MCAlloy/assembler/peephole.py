@@ -0,0 +1,121 @@
+from containers import ILModule, ILBlock
+from instrs import Comment, Mark, Load, LoadNBT, LoadScore, Store, StoreScore, Copy, CopyScores, SetNBT, Seek, TOS
+from instrs.operate import BinaryOp, CompareOp, HELD
+
+# Exact types are compared instead of using isinstance, which is slow on instructions since they are ABCs
+LOADS = (Load, LoadScore)
+STORES = (Store, StoreScore)
+OPERATIONS = (BinaryOp, CompareOp)
+
+
+def peephole_module(module: ILModule) -> ILModule:
+    peephole = Peephole()
+    for frame in module.frames:
+        for block in frame.blocks():
+            peephole.optimize_block(block)
+
+    module.removed["peephole"] = peephole.removed
+    return module
+
+
+class Peephole:
+    def __init__(self):
+        """
+        Removes and fuses neighbouring instructions in a block that move values through the stack for nothing, like
+        a load followed by a pop, or a store followed by loading the same value back. Every rewrite has the same stack
+        effect as the instructions it replaces, and comments between them are left where they are
+        """
+        self.removed = 0  # Commands removed, not counting comments
+
+    def optimize_block(self, block: ILBlock):
+        out = []
+        real = []  # Indexes in out of the instructions that aren't comments
+
+        for instr in block.instrs:
+            out.append(instr)
+            if type(instr) in (Comment, Mark):
+                continue
+
+            real.append(len(out) - 1)
+
+            # A rewrite can make the instruction before it fuse with the new one, so keep going until nothing does
+            while len(real) > 1 and self.rewrite(out, real):
+                pass
+
+        block.instrs = [instr for instr in out if instr is not None]
+
+    def rewrite(self, out: list, real: list) -> bool:
+        """
+        Try to rewrite the last two instructions written to out
+        :return: True if they were rewritten
+        """
+        positions = real[-2:]
+        window = [out[n] for n in positions]
+        new = self.match(*window)
+        if new is None:
+            return False
+
+        self.removed += sum(instr.size() for instr in window) - sum(instr.size() for instr in new)
+
+        del real[-2:]
+        for n in positions:
+            out[n] = None
+        for n, instr in zip(positions, new):
+            out[n] = instr
+            real.append(n)
+
+        return True
+
+    @staticmethod
+    def match(a, b):
+        """
+        :return: what to replace a and b with, or None if they can't be rewritten
+        """
+        ta, tb = type(a), type(b)
+        loads = ta in LOADS or ta is LoadNBT and type(a.args[0]) is TOS
+
+        # Values loaded and popped straight away
+        if loads and tb is Seek and b.delta == -1:
+            return []
+
+        # Values loaded and stored straight away are copied instead
+        if loads and is_store(b):
+            target, source = b.args[0], a.args[1]
+            if ta is LoadScore:
+                return [CopyScores(target, source)] if tb is StoreScore else None
+            if ta is LoadNBT:
+                return [SetNBT(target, source)] if tb is Store else None
+            return [Copy(target, source)] if tb is Store else [StoreScore(target, source)]
+
+        # Values stored and loaded back straight away are left on the stack
+        if is_store(a) and tb in LOADS and (ta is Store) == (tb is Load) and same_index(a.args[0], b.args[1]):
+            return [ta(a.args[0], pop=False)]
+
+        # Operands read by an operation from where they are loaded from
+        if ta in LOADS and tb in OPERATIONS:
+            if b.right is None:
+                return [b.altered(right=a.args[1])]
+            if b.left is None and b.right is not HELD:
+                return [b.altered(left=a.args[1])]
+
+        # Results of an operation that are stored or used straight away are kept in scores
+        if ta is BinaryOp and a.result is None:
+            if tb is StoreScore and b.stack_action == "pop":
+                return [a.altered(result=b.args[0])]
+            if tb in OPERATIONS and b.right is None:
+                return [a.altered(result=HELD), b.altered(right=HELD)]
+            if tb in OPERATIONS and b.left is None and b.right is not HELD:
+                return [a.altered(result=HELD), b.altered(left=HELD)]
+
+        return None
+
+
+def is_store(instr):
+    """
+    If instr only pops TOS into a name
+    """
+    return type(instr) in STORES and instr.stack_action == "pop"
+
+
+def same_index(a, b) -> bool:
+    return type(a) is type(b) and a.index == b.index
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+
+from alloy import nodes
+
+# Ops that leave an int on the stack when both of their operands are ints. Division and comparisons are done on
+# scoreboards, so their results are ints too
+INT_OPS = ("BINARY_", "INPLACE_")
+
+LOAD_OPS = ["LOAD_NAME", "LOAD_FAST", "LOAD_GLOBAL"]
+STORE_OPS = ["STORE_NAME", "STORE_FAST", "STORE_GLOBAL"]
+
+
+def int_locals(frame: nodes.Frame) -> list:
+    """
+    Find the locals of a frame that only ever hold ints, so they can be kept in scores on the frame's entity instead
+    of its Names NBT. A local qualifies when every value stored to it is an int constant, an int local, or arithmetic
+    or a comparison on those. Arguments, and anything a direct command reads from Names, stay in NBT
+    :return: the names, in the order they are first stored
+    """
+    # Name to the values stored to it, each a list of what the value depends on or None if it isn't an int
+    stores = OrderedDict()
+    directs = []
+
+    for node in frame_nodes(frame):
+        if isinstance(node, nodes.Byte):
+            for name, value in byte_stores(node.bytecode):
+                stores.setdefault(name, []).append(value)
+        elif isinstance(node, nodes.Direct):
+            directs.append(node.command)
+
+    candidates = [name for name in stores if name not in frame.args]
+    candidates = [name for name in candidates if not any("Names." + name in command for command in directs)]
+
+    # A local is only an int if the locals its values depend on are, so drop locals until nothing else changes
+    changed = True
+    while changed:
+        changed = False
+        for name in list(candidates):
+            if not all(value is not None and all(dep in candidates for dep in value) for value in stores[name]):
+                candidates.remove(name)
+                changed = True
+
+    return candidates
+
+
+def frame_nodes(frame: nodes.Frame):
+    """
+    Every node in the blocks of a frame. Frames of functions defined in it are not included
+    """
+    work = [frame.root_block]
+    while work:
+        block = work.pop()
+        yield from block.body
+        work.extend(link.block for link in block.links if link.block)
+
+
+def byte_stores(bytecode):
+    """
+    Follow the stack through a statement's bytecode to find what each store saves
+    :return: (name, value) pairs, value is the list of names an int value depends on, or None if it isn't an int
+    """
+    stack = []
+
+    def pop(n=1):
+        values = [stack.pop() if stack else None for _ in range(n)]
+        return values[::-1]
+
+    for instr in bytecode:
+        op = instr.opname
+
+        if op == "LOAD_CONST":
+            stack.append([] if type(instr.argval) is int else None)
+
+        elif op in LOAD_OPS:
+            stack.append([instr.argval])
+
+        elif op.startswith(INT_OPS) or op == "COMPARE_OP":
+            a, b = pop(2)
+            stack.append(a + b if a is not None and b is not None else None)
+
+        elif op in STORE_OPS:
+            yield instr.argval, pop()[0]
+
+        elif op == "DUP_TOP":
+            stack += pop() * 2
+
+        elif op == "DUP_TOP_TWO":
+            stack += pop(2) * 2
+
+        elif op == "ROT_TWO":
+            a, b = pop(2)
+            stack += [b, a]
+
+        elif op == "ROT_THREE":
+            a, b, c = pop(3)
+            stack += [c, a, b]
+
+        elif op == "CALL_FUNCTION":
+            pop(instr.arg + 1)
+            stack.append(None)
+
+        elif op == "LOAD_ATTR":
+            pop()
+            stack.append(None)
+
+        elif op == "STORE_ATTR":
+            pop(2)
+
+        elif op == "POP_TOP":
+            pop()
+
+        else:
+            # Anything else is either unsupported by the assembler or ends the statement
+            stack.clear()
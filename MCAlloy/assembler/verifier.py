@@ -0,0 +1,63 @@
+import error
+from containers import ILModule, ILFrame
+from instrs import Comment, Mark, BLOCK_LINKS
+
+
+def verify_module(doc: str, module: ILModule) -> ILModule:
+    verifier = StackVerifier(doc)
+    for frame in module.frames:
+        verifier.verify_frame(frame)
+    return module
+
+
+class StackVerifier:
+    def __init__(self, doc: str):
+        """
+        Checks the stack effect of every instruction along every path through a frame's blocks, before anything is
+        generated from them. The stack index starts at -1 (empty), each block starts where the block targeting it
+        was when it linked to it, and the root block has to leave the stack empty again
+        :param doc: source of the module, to show where a problem is
+        """
+        self.doc = doc
+
+    def verify_frame(self, frame: ILFrame):
+        work = [(frame.root_block, -1, None)]
+        root_end = None
+        last_line = None
+
+        while work:
+            block, index, line = work.pop()
+            starts = {}
+
+            for instr in block.instrs:
+                if isinstance(instr, (Comment, Mark)):
+                    line = instr.line if instr.line is not None else line
+                    last_line = line if line is not None else last_line
+                    continue
+
+                if type(instr) in BLOCK_LINKS:
+                    starts[instr.path] = index
+                pops, pushes = instr.stack_effect()
+                if index + 1 < pops:
+                    msg = "Stack underflow in {}, '{}' uses {} items but the stack only holds {}"
+                    # Paths without a line of their own point at the closest line before them
+                    self.error(line if line is not None else last_line,
+                               msg.format(block.path, str(instr).strip(), pops, index + 1))
+                index += pushes - pops
+
+            if root_end is None:
+                root_end = index
+
+            # Reversed, so targets are popped and checked in order
+            for target in reversed(block.targets):
+                work.append((target, starts.get(target.path, index), line))
+
+        # Root blocks are mostly bridges, so point at the end of the frame's source instead
+        if root_end != -1:
+            msg = "Stack is unbalanced at the end of {}, it should be empty but holds {} item(s)"
+            self.error(last_line, msg.format(frame.path, root_end + 1))
+
+    def error(self, line, msg):
+        if line is None:
+            error.compile_error(msg)
+        error.doc_error(line, self.doc, msg)
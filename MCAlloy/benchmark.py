@@ -0,0 +1,322 @@
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS isn't measured there
+    resource = None
+
+from mcalloy import build
+from settings import GenerationSettings
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# How much worse than the baseline a metric can get before it is a regression, as a fraction of the baseline
+THRESHOLDS = {
+    "wall": 0.25,
+    "peak_rss": 0.15,
+    "files": 0.0,
+    "bytes": 0.0,
+    "scans": 0.0,
+    "stages": 0.5
+}
+
+# Metrics that depend on the machine the benchmark runs on. The baseline kept with the compiler only holds the others,
+# save to a baseline of your own with --baseline to compare these
+MACHINE_METRICS = ("wall", "peak_rss", "stages")
+
+# Stages faster than this in the baseline are too noisy to compare
+MIN_STAGE_SECONDS = 0.05
+
+# Loaded entity counts the runtime cost of a call is modelled at
+ENTITY_COUNTS = (100, 10000, 1000000)
+
+# Entity selectors that check every loaded entity, ones limited to a distance only look at the entities around a spot
+GLOBAL_SELECTOR = re.compile(r"@e\[(?![^\]]*distance=)")
+
+
+def pack_modules(folder, scale):
+    """
+    Many small modules, each with some arithmetic, a branch and a function
+    """
+    for m in range(60 * scale):
+        lines = ["a = {}".format(m), "b = a * 3 + 1"]
+        lines += ["def f(x):", "    return x * 2 + a"]
+        for i in range(8):
+            lines += ["if b > {}:".format(i), "    b = f(b) - {}".format(i), "else:", "    b = b + {}".format(i)]
+        write_module(folder, "mods", "m{:04}".format(m), lines)
+
+
+def pack_nested(folder, scale):
+    """
+    Deeply nested if and while blocks, and a long elif chain
+    """
+    # CPython can't indent more than 100 levels
+    depth = min(90, 30 * scale)
+    lines = ["x = 1", "n = 0"]
+    for i in range(depth):
+        keyword = "while n < {}:" if i % 3 == 2 else "if x == {}:"
+        lines.append("    " * i + keyword.format(i + 1))
+    lines.append("    " * depth + "n = n + 1")
+    write_module(folder, "nested", "deep", lines)
+
+    lines = ["x = 7", "if x == 0:", "    y = 0"]
+    for i in range(1, 1000 * scale):
+        lines += ["elif x == {}:".format(i), "    y = x * {}".format(i)]
+    lines += ["else:", "    y = -1"]
+    write_module(folder, "nested", "chain", lines)
+
+
+def pack_functions(folder, scale):
+    """
+    Thousands of small functions, each called once
+    """
+    per_module = 200
+    for m in range(10 * scale):
+        lines = ["x = {}".format(m)]
+        for i in range(per_module):
+            lines += ["def f{}(a, b):".format(i), "    return a * {} + b".format(i), "x = f{}(x, {})".format(i, i)]
+        write_module(folder, "funcs", "f{:03}".format(m), lines)
+
+
+def pack_arithmetic(folder, scale):
+    """
+    Long runs of straight line arithmetic
+    """
+    for m in range(5 * scale):
+        lines = ["v0 = {}".format(m)]
+        for i in range(1, 1000):
+            lines.append("v{} = v{} * 3 + {} % 7 - v{} / 2".format(i, i - 1, i, i // 2))
+        write_module(folder, "arith", "a{:03}".format(m), lines)
+
+
+def pack_calls(folder, scale):
+    """
+    Call sites of a recursive function and a small one, for the call cost model
+    """
+    for m in range(5 * scale):
+        lines = ["def fib(n):", "    if n < 2:", "        return n", "    return fib(n - 1) + fib(n - 2)",
+                 "def add(a, b):", "    return a + b", "x = 0"]
+        for i in range(100):
+            lines.append("x = add(x, fib({}))".format(i % 10))
+        write_module(folder, "calls", "c{:03}".format(m), lines)
+
+
+def write_module(folder, namespace, name, lines):
+    os.makedirs(os.path.join(folder, namespace), exist_ok=True)
+    with open(os.path.join(folder, namespace, name + ".py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+SUITES = OrderedDict([
+    ("modules", pack_modules),
+    ("nested", pack_nested),
+    ("functions", pack_functions),
+    ("arithmetic", pack_arithmetic),
+    ("calls", pack_calls)
+])
+
+
+def measure(in_path, out_path, flags):
+    """
+    Build a pack and print what it cost as json. Run in its own process by run_suite, so peak RSS is only this build's
+    """
+    gs = GenerationSettings.from_argv(flags + ["QUIET", "--profile-time"])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = build(in_path, out_path, gs)
+        wall = time.perf_counter() - start
+
+    stages = OrderedDict()
+    for record in result.records:
+        stages[record.name] = stages.get(record.name, 0) + record.seconds
+
+    peak_rss = None
+    if resource is not None:
+        # Worker processes from --jobs count too. Linux reports KiB, macOS reports bytes
+        unit = 1 if sys.platform == "darwin" else 1024
+        peak_rss = unit * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    print(json.dumps({"wall": wall, "stages": stages, "peak_rss": peak_rss}))
+
+
+def run_suite(name, scale, repeat, flags):
+    """
+    Generate a suite's pack and build it repeat times, keeping the best time and memory of the builds
+    """
+    folder = tempfile.mkdtemp(prefix="mcalloy_bench_")
+    try:
+        in_path = os.path.join(folder, name)
+        out_path = os.path.join(folder, "out")
+        SUITES[name](in_path, scale)
+
+        best = None
+        for _ in range(repeat):
+            shutil.rmtree(out_path, ignore_errors=True)
+            cmd = [sys.executable, os.path.abspath(__file__), "measure", in_path, out_path] + flags
+            output = subprocess.run(cmd, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+            result = json.loads(output.strip().split("\n")[-1])
+
+            if best is None:
+                best = result
+            else:
+                best["wall"] = min(best["wall"], result["wall"])
+                if result["peak_rss"] is not None:
+                    best["peak_rss"] = min(best["peak_rss"], result["peak_rss"])
+                for stage, seconds in result["stages"].items():
+                    best["stages"][stage] = min(best["stages"].get(stage, seconds), seconds)
+
+        best["files"] = 0
+        best["bytes"] = 0
+        for path, dirs, files in os.walk(os.path.join(out_path, "datapacks")):
+            best["files"] += len(files)
+            best["bytes"] += sum(os.path.getsize(os.path.join(path, file)) for file in files)
+
+        best["calls"], best["scans"] = call_cost(os.path.join(out_path, "datapacks"))
+        return best
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def call_cost(datapacks):
+    """
+    Count the calls in a built pack, and the entity selectors in it that check every loaded entity. A call can't be
+    timed without a server, so its cost is modelled by those selectors: each one costs as much as there are entities
+    loaded, while every other command costs the same however many there are
+    :return: the number of call sites, and the selectors checking every entity per call site, or None without calls
+    """
+    calls = 0
+    scans = 0
+    for path, dirs, files in os.walk(datapacks):
+        for file in files:
+            if not file.endswith(".mcfunction"):
+                continue
+            with open(os.path.join(path, file), "r") as f:
+                for line in f:
+                    # Comments, and the debug and failure reports indented after each command, don't count
+                    if line.startswith("#") or line.startswith(" "):
+                        continue
+                    calls += "__callfunc__" in line
+                    scans += len(GLOBAL_SELECTOR.findall(line))
+
+    return calls, scans / calls if calls else None
+
+
+def compare(key, result, baseline, thresholds):
+    """
+    Print how a result compares to its baseline
+    :return: True if any metric regressed past its threshold
+    """
+    rows = [(metric, baseline.get(metric), result.get(metric), thresholds[metric])
+            for metric in ["wall", "peak_rss", "files", "bytes", "scans"]]
+    for stage, seconds in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is not None and base >= MIN_STAGE_SECONDS:
+            rows.append(("stage " + stage, base, seconds, thresholds["stages"]))
+        else:
+            rows.append(("stage " + stage, base, seconds, None))
+
+    regressed = False
+    print(key)
+    for metric, base, now, threshold in rows:
+        if base is None or now is None:
+            print("  {:<18} {:>14} {:>14}".format(metric, fmt(base), fmt(now)))
+            continue
+
+        change = (now - base) / base if base else 0.0
+        status = ""
+        if threshold is not None and change > threshold:
+            status = "REGRESSION (> {:.0%})".format(threshold)
+            regressed = True
+        print("  {:<18} {:>14} {:>14} {:>+8.1%}  {}".format(metric, fmt(base), fmt(now), change, status))
+
+    if result.get("scans") is not None:
+        costs = ", ".join("{} at {} entities".format(fmt(result["scans"] * count), count) for count in ENTITY_COUNTS)
+        print("  {} calls, each checks {}".format(result["calls"], costs))
+
+    return regressed
+
+
+def fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.3f}".format(value)
+    return str(value)
+
+
+def main(argv):
+    """
+    python benchmark.py [suites...] [--scale N] [--repeat N] [--baseline path] [--save] [build flags...]
+    Build flags, like STREAM or --jobs 4, are passed on to the compiler, and results are kept per suite, scale and flags
+    Timings and memory are only saved to a baseline given with --baseline, see MACHINE_METRICS
+    """
+    argv = list(argv)
+    scale = int(pop_option(argv, "--scale", 1))
+    repeat = int(pop_option(argv, "--repeat", 3))
+    baseline_path = pop_option(argv, "--baseline", BASELINE_PATH)
+    save = "--save" in argv
+    if save:
+        argv.remove("--save")
+
+    names = [arg for arg in argv if arg in SUITES] or list(SUITES)
+    flags = [arg for arg in argv if arg not in SUITES]
+
+    baselines = {"thresholds": THRESHOLDS, "results": {}}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r") as f:
+            baselines = json.load(f)
+    thresholds = dict(THRESHOLDS, **baselines.get("thresholds", {}))
+
+    regressed = False
+    for name in names:
+        key = "{} scale={} flags={}".format(name, scale, " ".join(flags))
+        result = run_suite(name, scale, repeat, flags)
+
+        baseline = baselines["results"].get(key)
+        if baseline is None:
+            baseline = {}
+        regressed = compare(key, result, baseline, thresholds) or regressed
+
+        if save:
+            if baseline_path == BASELINE_PATH:
+                result = {metric: value for metric, value in result.items() if metric not in MACHINE_METRICS}
+            baselines["results"][key] = result
+
+    if save:
+        baselines["thresholds"] = thresholds
+        with open(baseline_path, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved baseline to " + baseline_path)
+
+    return 1 if regressed and not save else 0
+
+
+def pop_option(argv, name, default):
+    """
+    Remove an option and its value from argv
+    """
+    value = GenerationSettings.option(argv, name, default)
+    if name in argv:
+        i = argv.index(name)
+        del argv[i:i + 2]
+    return value
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "measure":
+        measure(sys.argv[2], sys.argv[3], sys.argv[4:])
+    else:
+        sys.exit(main(sys.argv[1:]))
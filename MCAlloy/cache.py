@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+COMPILER_VERSION = "0.1"
+
+_compiler_hash = None
+
+
+def compiler_hash() -> str:
+    """
+    Hash of every source file in the compiler, so editing the compiler invalidates the cache without a version bump
+    """
+    global _compiler_hash
+
+    if _compiler_hash is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha1(COMPILER_VERSION.encode())
+        for folder, dirs, files in sorted(os.walk(root)):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(".py"):
+                    with open(os.path.join(folder, file), "rb") as f:
+                        h.update(f.read())
+        _compiler_hash = h.hexdigest()
+
+    return _compiler_hash
+
+
+class ModuleCache:
+    def __init__(self, folder: str, gs, memory: dict = None):
+        """
+        Persistent cache of the mcfunction output of each module, keyed by source, compiler and generation settings
+        :param folder: folder to keep cache entries in, it is created when the first entry is stored
+        :param memory: entries already loaded or stored in this process, shared between the packs of a batch build
+        """
+        self.folder = folder
+        self.settings_key = gs.key()
+        self.memory = memory
+
+    def __getstate__(self):
+        # Worker processes read entries from disk, rather than being sent every entry in memory
+        state = self.__dict__.copy()
+        state["memory"] = None
+        return state
+
+    def key(self, source_text: str) -> str:
+        h = hashlib.sha1()
+        for part in [compiler_hash(), self.settings_key, source_text]:
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @staticmethod
+    def module_name(module_path) -> str:
+        """
+        Entries are kept under the path of their module, so the path a module is loaded with, and the path of its
+        __module__ frame it is stored with after assembly, find the same entry
+        """
+        return str(module_path.altered(frame=None, block=None))
+
+    def entry_path(self, module_path) -> str:
+        name = hashlib.sha1(self.module_name(module_path).encode()).hexdigest()
+        return os.path.join(self.folder, name + ".json")
+
+    def load(self, module_path, key):
+        """
+        Get the files and source map previously emitted for a module, or None if the module has changed since
+        :return: (files, source map) or None
+        """
+        name = self.module_name(module_path)
+        if self.memory is not None and (name, key) in self.memory:
+            files, source_map = self.memory[(name, key)]
+            return OrderedDict(files), source_map
+
+        try:
+            with open(self.entry_path(module_path), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("key") != key:
+            return None
+
+        source_map = OrderedDict(entry["map"]) if entry.get("map") is not None else None
+        return OrderedDict(entry["files"]), source_map
+
+    def store(self, module_path, key, files, source_map=None):
+        if self.memory is not None:
+            self.memory[(self.module_name(module_path), key)] = (files, source_map)
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # Write then rename, so an interrupted build never leaves a half written entry behind
+        entry_path = self.entry_path(module_path)
+        with open(entry_path + ".tmp", "w") as f:
+            source_map = list(source_map.items()) if source_map is not None else None
+            json.dump({"key": key, "files": list(files.items()), "map": source_map}, f)
+        os.replace(entry_path + ".tmp", entry_path)
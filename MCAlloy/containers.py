@@ -1,12 +1,46 @@
+import copyreg
+import marshal
+import types
+import weakref
+from collections import OrderedDict
+
+
+def _pickle_code(code):
+    return marshal.loads, (marshal.dumps(code),)
+
+
+# Frames keep their code objects, register them with pickle so modules can be sent between worker processes
+copyreg.pickle(types.CodeType, _pickle_code)
+
+
 class Path:
-    def __init__(self, namespace: str = None, module: str = None, frame: str = None, block: str = None):
-        self.namespace = namespace
-        self.module = module
-        self.frame = frame
-        self.block = block
+    __slots__ = ("namespace", "module", "frame", "block", "_str", "_file", "__weakref__")
+
+    # Every live Path, so equal paths are the same object and only have their strings built once
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, namespace: str = None, module: str = None, frame: str = None, block: str = None):
+        key = (namespace, module, frame, block)
+        path = cls._interned.get(key)
+        if path is not None:
+            return path
 
         for i in range(0, 2):
-            assert self[i] is not None or self[i+1] is None
+            assert key[i] is not None or key[i+1] is None
+
+        path = super().__new__(cls)
+        path.namespace = namespace
+        path.module = module
+        path.frame = frame
+        path.block = block
+        path._str = None
+        path._file = None
+        cls._interned[key] = path
+        return path
+
+    def __reduce__(self):
+        # Intern paths again when they are unpickled
+        return Path, (self.namespace, self.module, self.frame, self.block)
 
     def altered(self, namespace="*", module="*", frame="*", block="*"):
         return Path(
@@ -20,6 +54,9 @@ class Path:
         return [self.namespace, self.module, self.frame, self.block][item]
 
     def __str__(self):
+        if self._str is not None:
+            return self._str
+
         s = []
 
         d = [
@@ -33,9 +70,13 @@ class Path:
             if text is not None:
                 s.append(pre + text)
 
-        return "".join(s)
+        self._str = "".join(s)
+        return self._str
 
     def file(self):
+        if self._file is not None:
+            return self._file
+
         s = ["data/"]
 
         if self.namespace is not None:
@@ -47,10 +88,13 @@ class Path:
             if self.block is not None:
                 s.append(("" if self.frame and self.frame.endswith("_") else "_") + self.block)
 
-        return "".join(s)
+        self._file = "".join(s)
+        return self._file
 
 
 class ILBlock:
+    __slots__ = ("path", "instrs", "targets")
+
     def __init__(self, path: Path):
         self.path = path
         self.instrs = []
@@ -69,12 +113,48 @@ class ILFrame:
         self.code = code
         self.root_block = None
 
+    def blocks(self):
+        """
+        Every block in the frame, each before the blocks it targets
+        """
+        work = [self.root_block] if self.root_block else []
+        while work:
+            block = work.pop()
+            yield block
+            work.extend(reversed(block.targets))
+
+    def __getstate__(self):
+        # Pickle the blocks as a flat list, pickling the nested targets would recurse once for every level of nesting
+        state = self.__dict__.copy()
+        blocks = list(self.blocks())
+        index = {id(block): i for i, block in enumerate(blocks)}
+        state["root_block"] = [(b.path, b.instrs, [index[id(t)] for t in b.targets]) for b in blocks]
+        return state
+
+    def __setstate__(self, state):
+        flat = state["root_block"]
+        blocks = []
+        for path, instrs, targets in flat:
+            block = ILBlock(path)
+            block.instrs = instrs
+            blocks.append(block)
+        for block, (path, instrs, targets) in zip(blocks, flat):
+            block.targets = [blocks[i] for i in targets]
+
+        self.__dict__.update(state)
+        self.root_block = blocks[0] if blocks else None
+
 
 class ILModule:
     def __init__(self, path: Path, source_path: str):
         self.path = path
         self.source_path = source_path
         self.frames = []
+        self.key = None  # Cache key of the source this module was assembled from
+        self.files = None  # Previously emitted mcfunctions, set instead of frames when loaded from the cache
+        self.source_map = None  # Source positions of the commands in each mcfunction, when making a source map
+        self.profile = []  # PassRecords of the passes run over this module, when profiling
+        self.removed = OrderedDict()  # Commands removed from this module by each optimization pass
 
     def push(self, frames: ILFrame):
         self.frames.append(frames)
@@ -13,6 +13,19 @@ def alloy_error(node, doc, msg):
     return doc_error(node.line, doc, msg)
 
 
+def compile_error(msg):
+    """
+    Report a problem with no line of the source to point at, like in code the compiler added itself
+    """
+    print(msg, file=sys.stderr)
+    quit(1)
+
+
+def usage_error(msg):
+    print(msg, file=sys.stderr)
+    sys.exit(1)
+
+
 def doc_error(line, doc, msg, pad=2):
     lines = doc.split("\n")
 
@@ -1,25 +1,80 @@
 from typing import Tuple, List
 
-from vm import VMIndex
+from vm import VMIndex, layout
 from instrs.base import CopyInstr, TOS, SimpleInstr, Instr
 
 
 class LoadNBT(SimpleInstr):
+    __slots__ = ()
+
     def __init__(self, nbt, target=TOS()):
-        super().__init__("LNBT", "data modify entity @s {} set from value {}", target, nbt, stack_action="push")
+        super().__init__("LNBT", "data modify {} set from value {}", target, nbt, stack_action="push")
 
 
 class Load(CopyInstr):
+    __slots__ = ()
+
     def __init__(self, index: VMIndex):
         super().__init__("LOAD", TOS(), index, stack_action="push")
 
 
 class Store(CopyInstr):
+    __slots__ = ()
+
+    def __init__(self, index: VMIndex, pop=True):
+        """
+        :param pop: remove TOS once it is stored, otherwise it is left for the next instruction
+        """
+        super().__init__("SNAM", index, TOS(), stack_action="pop" if pop else "none")
+
+
+class Copy(CopyInstr):
+    __slots__ = ()
+
+    def __init__(self, target: VMIndex, source: VMIndex):
+        """
+        Copy between two NBT indexes without going through the stack
+        """
+        super().__init__("COPY", target, source)
+
+
+class SetNBT(SimpleInstr):
+    __slots__ = ()
+
+    def __init__(self, target: VMIndex, nbt):
+        super().__init__("SNBT", "data modify {} set from value {}", target, nbt)
+
+
+class LoadScore(SimpleInstr):
+    __slots__ = ()
+
     def __init__(self, index: VMIndex):
-        super().__init__("SNAM", index, TOS(), stack_action="pop")
+        cmd = "execute store result {}.v int 1 run scoreboard players get {}"
+        super().__init__("LSCO", cmd, TOS(), index, stack_action="push")
+
+
+class StoreScore(SimpleInstr):
+    __slots__ = ()
+
+    def __init__(self, index: VMIndex, source=TOS(), pop=True):
+        """
+        :param source: NBT index to store the value of, TOS by default
+        :param pop: remove TOS once it is stored, otherwise it is left for the next instruction
+        """
+        cmd = "execute store result score {} run data get {}.v"
+        stack_action = "pop" if pop and isinstance(source, TOS) else "none"
+        super().__init__("SSCO", cmd, index, source, stack_action=stack_action)
+
+
+class CopyScores(SimpleInstr):
+    __slots__ = ()
+
+    def __init__(self, target: VMIndex, source: VMIndex):
+        super().__init__("CSCS", "scoreboard players operation {} = {}", target, source)
 
 
 class SetASM(SimpleInstr):
+    __slots__ = ()
     print_tag = False
 
     def __init__(self, key, val):
@@ -27,36 +82,48 @@ class SetASM(SimpleInstr):
 
 
 class CopyScore(SimpleInstr):
+    __slots__ = ()
+
     def __init__(self, player, score="__asm__", attr="v", target=TOS()):
-        cmd = "execute store result entity @s {}.{} int 1 run scoreboard players get {} {}"
+        cmd = "execute store result {}.{} int 1 run scoreboard players get {} {}"
         super().__init__("CSCO", cmd, target, attr, player, score)
 
 
 class LoadAttr(Instr):
+    __slots__ = ("name_index",)
+
     def __init__(self, name_index):
         self.name_index = name_index
 
     def gen(self, i):
-        yield "execute store result score t0 __asm__ run data get entity @s {}.a".format(repr(i))
+        yield "execute store result score t0 __asm__ run data get {}.a".format(repr(i))
 
+        # Run as the object, which finds the frame by its __target__ tag
         yield "tag @s add __target__"
-        copy = "data modify set @e[tag=__target__,limit=1] {} from entity @s {}".format(repr(i), repr(self.name_index))
+        target = layout().select("tag=__target__,limit=1")
+        copy = "data modify set {} from {}".format(i.on(target), self.name_index.on("@s"))
         yield "execute as @e[] run execute if score @s __ptr__ = t0 __asm__ run " + copy
         yield "tag @s remove __target__"
 
     def str(self):
         return "LATR", TOS(), self.name_index
 
+    def stack_effect(self):
+        return 1, 1
+
 
 class StoreAttr(Instr):
+    __slots__ = ("name_index",)
+
     def __init__(self, name_index):
         self.name_index = name_index
 
     def gen(self, i):
-        yield "execute store result score t0 __asm__ run data get entity @s {}.a".format(repr(i))
+        yield "execute store result score t0 __asm__ run data get {}.a".format(repr(i))
         i.pop()
         yield "tag @s add __target__"
-        copy = "data modify set @s {} from entity @e[tag=__target__,limit=1] {}".format(repr(self.name_index), repr(i))
+        target = layout().select("tag=__target__,limit=1")
+        copy = "data modify set {} from {}".format(self.name_index.on("@s"), i.on(target))
         i.pop()
         yield "execute as @e[] run execute if score @s __ptr__ = t0 __asm__ run " + copy
         yield "tag @s remove __target__"
@@ -64,8 +131,13 @@ class StoreAttr(Instr):
     def str(self):
         return "SATR", TOS(), self.name_index
 
+    def stack_effect(self):
+        return 2, 0
+
 
 class Shuffle(Instr):
+    __slots__ = ("assigns", "seek")
+
     def __init__(self, assigns: List[Tuple[int, int]], seek):
         self.assigns = assigns
         self.seek = seek
@@ -74,9 +146,14 @@ class Shuffle(Instr):
         for assign in self.assigns:
             v0 = i.off(assign[0])
             v1 = i.off(assign[1])
-            yield "data modify entity @s {} set from entity @s {}".format(repr(v0), repr(v1))
+            yield "data modify {} set from {}".format(repr(v0), repr(v1))
         i.alter(self.seek)
 
     def str(self):
         s = ", ".join(["{} < {}".format(*a) for a in self.assigns])
         return "SHFL", s, TOS()
+
+    def stack_effect(self):
+        # Offsets above TOS are free space, offsets at or below it have to be on the stack
+        used = 1 - min([0] + [offset for assign in self.assigns for offset in assign])
+        return used, used + self.seek
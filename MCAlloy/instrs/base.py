@@ -2,19 +2,22 @@ from abc import ABC, abstractmethod
 from typing import Tuple, Union
 
 from util import escape
-from vm import StackIndex, VMIndex
+from vm import StackIndex, VMIndex, layout
 
 
 class TOS:
+    __slots__ = ()
+
     def __str__(self):
         return "TOS"
 
 
 class BaseInstr(ABC):
-    pass
+    __slots__ = ()
 
 
 class Instr(BaseInstr):
+    __slots__ = ()
     debug_before = False
     warn_fail = True
     print_tag = True
@@ -28,6 +31,26 @@ class Instr(BaseInstr):
     def str(self) -> Tuple:
         pass
 
+    def gen_storage(self, i: StackIndex):
+        """
+        Generate the commands of this instruction for the storage backend, where the running frame is the last
+        compound in the Frames list of storage instead of the NBT of @s. VMIndexes give their place in storage
+        themselves, so only instructions that handle frames or entities need commands of their own
+        """
+        return self.gen(i)
+
+    def stack_effect(self) -> Tuple[int, int]:
+        """
+        How many items from the top of the stack this instruction uses, and how many are there when it is done
+        """
+        return 0, 0
+
+    def size(self) -> int:
+        """
+        How many commands this instruction generates, not counting comments and debug lines
+        """
+        return sum(1 for _ in self.gen(StackIndex(0)))
+
     def debug_str(self, i: StackIndex) -> str:
         s = self.str()
 
@@ -43,23 +66,24 @@ class Instr(BaseInstr):
 
         if self.print_tag:
             yield tellraw.format(",".join([
-                '{"text":" >>> STACK: "},{"nbt":"ArmorItems[0].tag","entity":"@s"}',
+                '{"text":" >>> STACK: "},' + layout().text(),
                 '{"text":"TAGS: "},{"nbt":"Tags","entity":"@s"}'
             ]))
 
     def generate(self, i: StackIndex, gs):
-        lines = self.comment_line(" - " + ", ".join(map(str, self.str())), gs.warn_fail, gs.comment)
+        """
+        Generate the lines of this instruction one at a time, i is altered as the lines are generated
+        """
+        yield from self.comment_line(" - " + ", ".join(map(str, self.str())), gs.warn_fail, gs.comment)
 
         if gs.debug and self.debug_before:
-            lines.extend(self.debug_line(i))
+            yield from self.debug_line(i)
 
-        for command in list(self.gen(i)):
-            lines.extend(self.command_line(command, gs.warn_fail and self.warn_fail))
+        for command in self.gen_storage(i) if gs.storage else self.gen(i):
+            yield from self.command_line(command, gs.warn_fail and self.warn_fail)
 
         if gs.debug and not self.debug_before:
-            lines.extend(self.debug_line(i))
-
-        return lines
+            yield from self.debug_line(i)
 
     def command_line(self, command, warn_fail):
         pre = "execute store success score pass __asm__ run " if warn_fail else ""
@@ -87,6 +111,8 @@ class Instr(BaseInstr):
 
 
 class SimpleInstr(Instr):
+    __slots__ = ("args", "form", "name", "stack_action")
+
     def __init__(self, name: str, form: str, *args, stack_action="none"):
         self.args = args
         self.form = form
@@ -108,8 +134,16 @@ class SimpleInstr(Instr):
     def str(self):
         return [self.name, *self.args]
 
+    def stack_effect(self):
+        return {"push": (0, 1), "pop": (1, 0), "none": (0, 0)}[self.stack_action]
+
+    def size(self):
+        return 1
+
 
 class CopyInstr(SimpleInstr):
+    __slots__ = ()
+
     def __init__(self, name, target: Union[TOS, VMIndex], source: Union[TOS, VMIndex], stack_action="none"):
-        form = "data modify entity @s {} set from entity @s {}"
+        form = "data modify {} set from {}"
         super().__init__(name, form, target, source, stack_action=stack_action)
@@ -1,9 +1,11 @@
 from instrs import SetASM, Instr, TOS, LoadNBT
 from util import to_nbt
 from containers import Path
+from vm import layout
 
 
 class Call(Instr):
+    __slots__ = ("path",)
     print_tag = False
     debug_before = True
 
@@ -15,13 +17,18 @@ class Call(Instr):
         self.path = path
 
     def gen(self, i):
-        yield "execute as @e[tag=__dest__,limit=1] run function {}".format(self.path)
+        yield "execute as {} run function {}".format(layout().select("tag=__dest__,limit=1"), self.path)
+
+    def gen_storage(self, i):
+        # The called frame is the last one in storage, there is no entity to run it as
+        yield "function {}".format(self.path)
 
     def str(self):
         return "CALL", self.path
 
 
 class CallBlock(Call):
+    __slots__ = ()
     print_tag = False
 
     def __init__(self, path: Path):
@@ -34,8 +41,11 @@ class CallBlock(Call):
     def gen(self, i):
         yield "function {}".format(self.path)
 
+    gen_storage = Instr.gen_storage
+
 
 class BlockBridge(CallBlock):
+    __slots__ = ()
     print_tag = False
 
     def __init__(self, path):
@@ -53,6 +63,7 @@ class BlockBridge(CallBlock):
 
 
 class CallBlockIf(CallBlock):
+    __slots__ = ("invert",)
     debug_before = True
 
     def __init__(self, path: Path, invert=False):
@@ -66,14 +77,22 @@ class CallBlockIf(CallBlock):
 
     def gen(self, i):
         match = 0 if self.invert else 1
-        yield "execute store result score test __asm__ run data get entity @s {}.v".format(repr(i))
+        yield "execute store result score test __asm__ run data get {}.v".format(repr(i))
         yield "execute if score test __asm__ matches {} run function {}".format(match, self.path)
 
     def str(self):
         return "CAL?", self.path, TOS(), "== 0" if self.invert else "== 1"
 
+    def stack_effect(self):
+        return 1, 1
+
+
+# Instructions that call another block of the same frame, compared by exact type since instructions are ABCs
+BLOCK_LINKS = (CallBlock, BlockBridge, CallBlockIf)
+
 
 class Return(Instr):
+    __slots__ = ("value",)
     print_tag = False
 
     def __init__(self, value=TOS()):
@@ -87,12 +106,25 @@ class Return(Instr):
         for line in list(self._gen(i)):
             yield 'execute if score ret __asm__ matches 0 run ' + line
 
-    def _gen(self, i):
+    def gen_storage(self, i):
+        # The frame returning is the last one in storage, so there is no entity to tag
+        for line in list(self._gen(i, False)):
+            yield 'execute if score ret __asm__ matches 0 run ' + line
+
+    def _gen(self, i, tag=True):
         if not isinstance(self.value, TOS):
             yield from LoadNBT(to_nbt(self.value)).gen(i)
-        yield 'tag @s add __ret__'
+        if tag:
+            yield 'tag @s add __ret__'
         yield from SetASM("ret", 1).gen(i)
         i.pop()
 
     def str(self):
         return "RTRN", self.value
+
+    def stack_effect(self):
+        return (1, 0) if isinstance(self.value, TOS) else (0, 0)
+
+
+# Instructions without arguments hold no state, so every block shares the same one
+RETURN_TOS = Return()
@@ -1,44 +1,102 @@
 from containers import Path
 from util import to_nbt
-from vm import StackIndex, PreIndex, NameIndex
+from vm import StackIndex, PreIndex, NameIndex, STORAGE, layout
 from instrs import Instr, TOS, LoadNBT, CopyScore
 
 
 class InitContext(Instr):
-    def __init__(self, copy_count):
+    __slots__ = ("copy_count", "pooled", "mounted")
+
+    def __init__(self, copy_count, pooled=False, mounted=False):
         """
         Creates a new armor stand with basic NBT scaffolding, as well as __dest__ and __volatile__ tags
         Then copies over copy_count items from @s to __dest__'s Pre section without changing order
+        :param pooled: take a __free__ armor stand released by an earlier call if there is one, and only summon one if
+        the pool is empty. Its data is reset with a single write
+        :param mounted: summon the armor stand where @s is and mount it on @s, so the caller reaches it as its passenger
+        instead of looking for __dest__ among every entity. The arguments go through storage
         """
         self.copy_count = copy_count
+        self.pooled = pooled
+        self.mounted = mounted
+
+    @property
+    def warn_fail(self):
+        # Taking a frame from the pool runs commands that fail when it is empty
+        return not self.pooled
 
     def gen(self, i):
-        pstr = ",".join(["{}"] * self.copy_count)
-        nbt = '{Tags:["__dest__", "__volatile__"]},' \
-              'ArmorItems:[{id:"minecraft:paper",Count:1b,tag:{Pre:[' + pstr + ']}},{},{},{}]'
-        yield 'summon minecraft:armor_stand ~ ~1 ~ ' + nbt
+        if self.mounted:
+            yield from self.gen_mounted(i)
+            return
+
+        vm = layout()
+        free = vm.select("tag=__free__,limit=1")
+        dest = vm.select("tag=__dest__,limit=1")
+        data = "{Pre:[" + ",".join(["{}"] * self.copy_count) + "]}"
+        if self.pooled:
+            yield "execute if entity {} run scoreboard players remove pool_free __asm__ 1".format(free)
+            yield "execute unless entity {} run {}".format(free, vm.summon("~ ~1 ~", ["__free__", "__volatile__"]))
+            yield "tag {} add __dest__".format(free)
+            yield "tag {} remove __free__".format(dest)
+            yield vm.reset(dest, data)
+        else:
+            yield vm.summon("~ ~1 ~", ["__dest__", "__volatile__"], data)
 
         for index in list(reversed(range(0, self.copy_count))):
             target = PreIndex(index)
-            yield "data modify entity @e[tag=__dest__,limit=1] {} set from entity @s {}".format(repr(target), repr(i))
+            yield "data modify {} set from {}".format(target.on(dest), repr(i))
+            i.pop()
+
+    def gen_mounted(self, i):
+        # A data command can't name the passenger of @s, so the arguments are gathered in storage and copied over
+        # as the passenger once it is mounted
+        if self.copy_count:
+            pstr = ",".join(["{}"] * self.copy_count)
+            yield "data modify storage {} Args set value [{}]".format(STORAGE, pstr)
+            for index in reversed(range(self.copy_count)):
+                yield "data modify storage {} Args[{}] set from {}".format(STORAGE, index, repr(i))
+                i.pop()
+
+        # Only the new armor stand is __dest__, and it is right where @s is, so finding it only looks around there
+        yield "execute at @s run " + layout().summon("~ ~ ~", ["__dest__", "__volatile__"], "{}")
+        # distance is measured from where the command runs, which has to be @s for the lookup to find it
+        yield "execute at @s run ride {} mount @s".format(layout().select("tag=__dest__,distance=..0.01,limit=1"))
+
+        if self.copy_count:
+            cmd = "execute on passengers run data modify {} set from storage {} Args"
+            yield cmd.format(layout().frame() + ".Pre", STORAGE)
+
+    def gen_storage(self, i):
+        # The new frame is appended after the caller's, which is the second to last frame from then on
+        pstr = ",".join(["{}"] * self.copy_count)
+        yield "data modify storage {} Frames append value {{Pre:[{}]}}".format(STORAGE, pstr)
+
+        for index in reversed(range(self.copy_count)):
+            target = PreIndex(index)
+            yield "data modify {} set from {}".format(target.frame(), i.frame(2))
             i.pop()
 
     def str(self):
         return "ICTX", TOS()
 
+    def stack_effect(self):
+        return self.copy_count, 0
+
 
 class InitObject(Instr):
+    __slots__ = ()
+
     def __init__(self):
         """
         Creates a new armor stand to store and reference data. Pointer to pushed to stack
         """
 
     def gen(self, i):
-        nbt = '{Tags:["__dest__", "__volatile__"]},' \
-              'ArmorItems:[{id:"minecraft:paper",Count:1b,tag:{Attr:{}}},{},{},{}]'
-        yield 'summon minecraft:armor_stand ~ ~1 ~ ' + nbt
+        yield layout().summon("~ ~1 ~", ["__dest__", "__volatile__"], "{Attr:{}}")
 
-        yield 'scoreboard players operate @e[tag=__dest__,limit=1] __ptr__ = ptr_count __asm__'
+        dest = layout().select("tag=__dest__,limit=1")
+        yield "scoreboard players operate {} __ptr__ = ptr_count __asm__".format(dest)
         i.push()
         yield from LoadNBT('{a:-1,t:"ptr"}').gen(i)
         yield from CopyScore("ptr_count").gen(i)
@@ -47,8 +105,13 @@ class InitObject(Instr):
     def str(self):
         return "IOBJ", TOS()
 
+    def stack_effect(self):
+        return 0, 2
+
 
 class StartFrame(Instr):
+    __slots__ = ("consts", "height", "is_func", "var_names")
+
     def __init__(self, code, is_func):
         """
         Run at the start of a frame. Sets up @s NBT to store vm information like Stack, Consts, and Names
@@ -65,46 +128,127 @@ class StartFrame(Instr):
 
         cstr = ",".join(map(lambda c: to_nbt(c, False), self.consts))
         sstr = ",".join(["{}"] * (self.height + 1))  # +1 to height because some instructions use the extra spot to swap
-        cmd = 'data modify entity @s ArmorItems[0].tag set from value {{Stack:[{}],Consts:[{}],Names:{{}}}}'
-        yield cmd.format(sstr, cstr)
+        cmd = 'data modify {} set from value {{Stack:[{}],Consts:[{}],Names:{{}}}}'
+        yield cmd.format(layout().frame(), sstr, cstr)
+
+        for i, var_name in enumerate(self.var_names):
+            source = PreIndex(i)
+            target = NameIndex(var_name)
+            yield "data modify {} set from {}".format(repr(target), repr(source))
+
+    def gen_storage(self, i):
+        # The frame was appended with its arguments in Pre by the caller, so it is merged into to keep them
+        cstr = ",".join(map(lambda c: to_nbt(c, False), self.consts))
+        sstr = ",".join(["{}"] * (self.height + 1))
+        cmd = "data modify {} merge value {{Stack:[{}],Consts:[{}],Names:{{}}}}"
+        yield cmd.format(layout().frame(), sstr, cstr)
 
         for i, var_name in enumerate(self.var_names):
             source = PreIndex(i)
             target = NameIndex(var_name)
-            yield "data modify entity @s {} set from entity @s {}".format(repr(target), repr(source))
+            yield "data modify {} set from {}".format(repr(target), repr(source))
 
     def str(self):
         return "IFRM", self.height
 
 
 class CallFuncPointer(Instr):
-    def __init__(self):
+    __slots__ = ("mounted",)
+
+    def __init__(self, mounted=False):
         """
         Resolves TOS as a function pointer, and calls the resolved function on __dest__
+        :param mounted: call it on the passenger of @s, which InitContext mounted there
         """
+        self.mounted = mounted
 
     def gen(self, i):
         super().gen(i)
-        yield "execute store result score fptr __asm__ run data get entity @s {}".format(repr(i))
-        yield "execute as @e[tag=__dest__,limt=1] run function {}".format(Path("__callfunc__"))
+        yield "execute store result score fptr __asm__ run data get {}".format(repr(i))
+        if self.mounted:
+            yield "execute on passengers run function {}".format(Path("__callfunc__"))
+        else:
+            yield "execute as {} run function {}".format(layout().select("tag=__dest__,limt=1"), Path("__callfunc__"))
+        i.pop()
+
+    def gen_storage(self, i):
+        # InitContext has appended the frame of the callee already, so the pointer is in the caller's frame below it
+        yield "execute store result score fptr __asm__ run data get {}".format(i.frame(2))
+        yield "function {}".format(Path("__callfunc__"))
         i.pop()
 
     def str(self):
         return "XFNC",
 
+    def stack_effect(self):
+        return 1, 0
+
 
 class EndCall(Instr):
-    def __init__(self):
+    __slots__ = ("reset_scores", "pool", "mounted")
+
+    def __init__(self, reset_scores=False, pool=0, mounted=False):
         """
         Finish a function call. Takes BOS from __ret__ and pushes it to @s, simulating a return
         Afterward it kills __ret__, if it is __volatile__
+        :param reset_scores: reset the scores of __ret__ before killing it, for frames that keep locals in scores
+        :param pool: release __ret__ to the pool of __free__ frames instead of killing it, unless pool frames are free
+        already. pool_free __asm__ counts them
+        :param mounted: take the returned frame as the passenger of @s instead of __ret__
         """
         # TODO change BOS to TOS
+        self.reset_scores = reset_scores
+        self.pool = pool
+        self.mounted = mounted
+
+    @property
+    def warn_fail(self):
+        # Releasing a frame to the pool runs commands that fail when it is full
+        return not self.pool
 
     def gen(self, i):
+        if self.mounted:
+            yield from self.gen_mounted(i)
+            return
+
+        ret = layout().select("tag=__ret__,limit=1")
+        volatile = layout().select("tag=__ret__,tag=__volatile__,limit=1")
+        i.push()
+        yield "data modify {} set from {}".format(repr(i), StackIndex(0).on(ret))
+        if self.reset_scores:
+            yield "scoreboard players reset {}".format(volatile)
+        if self.pool:
+            yield "execute if score pool_free __asm__ matches {}.. run kill {}".format(self.pool, volatile)
+            yield "execute if entity {} run scoreboard players add pool_free __asm__ 1".format(volatile)
+            yield "tag {} add __free__".format(volatile)
+            yield "tag {} remove __ret__".format(layout().select("tag=__free__,tag=__ret__,limit=1"))
+        else:
+            yield "kill {}".format(volatile)
+
+    def gen_mounted(self, i):
+        # Like the arguments, what is returned goes through storage on its way from the passenger
         i.push()
-        yield "data modify entity @s {} set from entity @e[tag=__ret__,limit=1] {}".format(repr(i), repr(StackIndex(0)))
-        yield 'kill @e[tag=__ret__,tag=__volatile__,limit=1]'
+        yield "execute on passengers run data modify storage {} Return set from {}".format(STORAGE, repr(StackIndex(0)))
+        yield "data modify {} set from storage {} Return".format(repr(i), STORAGE)
+        if self.reset_scores:
+            yield "execute on passengers run scoreboard players reset @s"
+        yield "execute on passengers run kill @s"
+
+    def gen_storage(self, i):
+        # The frame that returned is still the last one, on top of the caller's
+        i.push()
+        yield "data modify {} set from {}".format(i.frame(2), repr(StackIndex(0)))
+        yield "data remove storage {} Frames[-1]".format(STORAGE)
 
     def str(self):
         return "ENDC", TOS()
+
+    def stack_effect(self):
+        return 0, 1
+
+
+# Instructions without arguments hold no state, so every block shares the same one
+CALL_FUNC_POINTER = CallFuncPointer()
+CALL_PASSENGER = CallFuncPointer(True)
+END_CALL = EndCall()
+END_CALL_SCORES = EndCall(True)
@@ -2,6 +2,7 @@ from instrs import SimpleInstr, Instr, TOS
 
 
 class Direct(SimpleInstr):
+    __slots__ = ()
     debug_before = True
 
     def __init__(self, command: str):
@@ -9,20 +10,53 @@ class Direct(SimpleInstr):
 
 
 class Comment(Instr):
-    def __init__(self, message):
+    __slots__ = ("message", "line")
+
+    def __init__(self, message, line=None):
+        """
+        :param line: the source line the instructions following this comment were compiled from, if it marks one
+        """
         self.message = message
+        self.line = line
 
     def gen(self, i):
         pass
 
     def generate(self, i, gs):
-        return self.comment_line(self.message, gs.warn_fail, gs.comment)
+        yield from self.comment_line(self.message, gs.warn_fail, gs.comment)
 
     def str(self):
         return "#", self.message
 
+    def size(self):
+        return 0
+
+
+class Mark(Instr):
+    __slots__ = ("line", "offset")
+
+    def __init__(self, line, offset):
+        """
+        Generates nothing, marks the source line and bytecode offset the instructions after it were assembled from
+        """
+        self.line = line
+        self.offset = offset
+
+    def gen(self, i):
+        yield from []
+
+    def generate(self, i, gs):
+        yield from []
+
+    def str(self):
+        return "MARK", self.line, self.offset
+
+    def size(self):
+        return 0
+
 
 class Seek(Instr):
+    __slots__ = ("delta",)
     print_tag = False
 
     def __init__(self, delta):
@@ -35,8 +69,15 @@ class Seek(Instr):
     def str(self):
         return "SEEK", self.delta, TOS()
 
+    def stack_effect(self):
+        return (-self.delta, 0) if self.delta < 0 else (0, self.delta)
+
+    def size(self):
+        return 0
+
 
 class NOOP(Instr):
+    __slots__ = ()
     print_tag = False
 
     def __init__(self):
@@ -47,3 +88,8 @@ class NOOP(Instr):
 
     def str(self):
         return "NOOP"
+
+
+# Instructions without arguments hold no state, so every block shares the same one
+NOP = NOOP()
+POP = Seek(-1)
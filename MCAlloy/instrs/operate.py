@@ -1,41 +1,128 @@
+import copy
+
 from instrs import Instr, TOS, CopyScore
+from vm import ScoreIndex
+
+
+class Held:
+    __slots__ = ()
+
+    def __str__(self):
+        return "t0"
+
+
+# An operand or result held in t0 between two operations, instead of on the stack
+HELD = Held()
 
 
 class BinaryOp(Instr):
-    def __init__(self, op):
+    __slots__ = ("op", "left", "right", "result")
+    result_score = "t0"
+    operate_size = 1
+
+    def __init__(self, op, left=None, right=None, result=None):
+        """
+        Operate on the top two items of the stack, and push the result. The peephole optimizer can take operands from
+        elsewhere and put the result elsewhere, so they don't go through the stack
+        :param left: a VMIndex to read the left operand from, or HELD if the operation before left it in t0
+        :param right: a VMIndex to read the right operand from, or HELD if the operation before left it in t0
+        :param result: a ScoreIndex to store the result in, or HELD to leave it in t0 for the next operation
+        """
         self.op = op
+        self.left = left
+        self.right = right
+        self.result = result
 
     def gen(self, i):
-        yield "execute store result score t1 __asm__ run data get entity @s {}.v".format(repr(i))
-        i.pop()
-        yield "execute store result score t0 __asm__ run data get entity @s {}.v".format(repr(i))
-        yield from self.operate(i)
+        right = "t1 __asm__"
+        if self.right is None:
+            yield "execute store result score t1 __asm__ run data get {}.v".format(repr(i))
+            i.pop()
+        elif self.right is HELD:
+            yield "scoreboard players operation t1 __asm__ = t0 __asm__"
+        elif isinstance(self.right, ScoreIndex):
+            right = repr(self.right)
+        else:
+            yield "execute store result score t1 __asm__ run data get {}.v".format(repr(self.right))
+
+        # Operate on a score in place when it is both the left operand and where the result goes
+        if self.in_place():
+            yield "scoreboard players operation {} {} {}".format(repr(self.left), self.op, right)
+            return
+
+        if self.left is None:
+            yield "execute store result score t0 __asm__ run data get {}.v".format(repr(i))
+            i.pop()
+        elif isinstance(self.left, ScoreIndex):
+            yield "scoreboard players operation t0 __asm__ = {}".format(repr(self.left))
+        elif self.left is not HELD:
+            yield "execute store result score t0 __asm__ run data get {}.v".format(repr(self.left))
 
-    def operate(self, i):
-        yield "scoreboard players operation t0 __asm__ {} t1 __asm__".format(self.op)
-        yield from CopyScore("t0").gen(i)
+        yield from self.operate(right)
+
+        if self.result is None:
+            i.push()
+            yield from CopyScore(self.result_score).gen(i)
+        elif self.result is not HELD:
+            yield "scoreboard players operation {} = {} __asm__".format(repr(self.result), self.result_score)
+
+    def operate(self, right):
+        yield "scoreboard players operation t0 __asm__ {} {}".format(self.op, right)
+
+    def in_place(self):
+        return isinstance(self.left, ScoreIndex) and isinstance(self.result, ScoreIndex) and \
+            self.left.index == self.result.index
+
+    def altered(self, **kwargs):
+        """
+        Make a copy of this operation with some of its operands or its result moved
+        """
+        op = copy.copy(self)
+        for name, value in kwargs.items():
+            setattr(op, name, value)
+        return op
 
     def str(self):
-        return "BIOP", TOS(), self.op
+        s = ["BIOP", TOS(), self.op]
+        if (self.left, self.right, self.result) != (None, None, None):
+            operands = [TOS() if a is None else a for a in (self.left, self.right, self.result)]
+            s.append("{} {} {} > {}".format(operands[0], self.op, *operands[1:]))
+        return s
+
+    def stack_effect(self):
+        return (self.left is None) + (self.right is None), int(self.result is None)
+
+    def size(self):
+        # Follows gen: reading each operand, operating, and storing the result each take a command unless it's kept
+        # in a score
+        size = int(not isinstance(self.right, ScoreIndex))
+        if self.in_place():
+            return size + 1
+        size += self.left is not HELD
+        return size + self.operate_size + (self.result is not HELD)
 
 
 class CompareOp(BinaryOp):
-    def __init__(self, op):
+    __slots__ = ("invert",)
+    result_score = "t2"
+    operate_size = 2
+
+    def __init__(self, op, left=None, right=None, result=None):
         if op == "!=":
             op = "="
             self.invert = True
         else:
             self.invert = False
-        super().__init__(op)
+        super().__init__(op, left, right, result)
 
-    def operate(self, i):
+    def operate(self, right):
         i0 = 1 if self.invert else 0
         i1 = 1 - i0
         yield "scoreboard players set t2 __asm__ {}".format(i0)
-        yield "execute if score t0 __asm__ {} t1 __asm__ run scoreboard players set t2 __asm__ {}".format(self.op, i1)
-        yield from CopyScore("t2").gen(i)
-
-    def str(self):
-        return "COMP", TOS(), self.op
+        yield "execute if score t0 __asm__ {} {} run scoreboard players set t2 __asm__ {}".format(self.op, right, i1)
 
+    def in_place(self):
+        return False
 
+    def str(self):
+        return ["COMP"] + super().str()[1:]
@@ -1,29 +1,123 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
 from assembler.datapack import ILDatapackGenerator
+from cache import ModuleCache
 from mcgen import DatapackGenerator
+from passes import report
+from settings import GenerationSettings
+from watch import watch
+import os
 import sys
+import time
+import traceback
 
 
 class ParseException(Exception):
     pass
 
 
-def comp(in_path, out_path, gs):
-    dpack_il_gen = ILDatapackGenerator(in_path)
-    namespaces = dpack_il_gen.assemble()
+class BuildResult:
+    def __init__(self, name: str, target: str, file_count: int, size: int, seconds: float, records: list, ok=True):
+        """
+        What building a datapack produced
+        :param name: name of the datapack
+        :param target: the folder or zip archive the datapack was written to
+        :param file_count: number of files in the datapack
+        :param size: bytes in the datapack's files
+        :param seconds: how long building the datapack took, in seconds
+        :param records: PassRecords of every pass, when profiling
+        :param ok: False if the datapack failed to compile, and nothing was written
+        """
+        self.name = name
+        self.target = target
+        self.file_count = file_count
+        self.size = size
+        self.seconds = seconds
+        self.records = records
+        self.ok = ok
+
+
+def build(in_path: str, out_path: str, gs: GenerationSettings = None, executor=None, memory=None) -> BuildResult:
+    """
+    Compile the datapack in in_path into out_path/datapacks
+    :param gs: settings to build with, the defaults when not given
+    :param executor: process pool to assemble modules on with more than one job, shared by the packs of a batch build
+    :param memory: in memory module cache entries, shared by the packs of a batch build
+    """
+    gs = gs or GenerationSettings()
+    start = time.perf_counter()
 
+    name = os.path.basename(os.path.normpath(in_path))
+    cache = ModuleCache(os.path.join(out_path, ".mcalloy_cache", name), gs, memory) if gs.cache else None
+
+    dpack_il_gen = ILDatapackGenerator(in_path, gs, cache, executor)
     dp_folder = "{}/datapacks/{}/".format(out_path, dpack_il_gen.name)
+    dpack_gen = DatapackGenerator(gs, cache)
+
+    if gs.stream:
+        namespace_gens = dpack_il_gen.namespace_gens()
+        modules = dpack_il_gen.stream(namespace_gens)
+        dpack_gen.stream(dp_folder, [gen.path for gen in namespace_gens], modules)
+    else:
+        namespaces = dpack_il_gen.assemble()
+        dpack_gen.generate(dp_folder, namespaces)
+
+    if gs.profile:
+        report(dpack_gen.records)
+
+    return BuildResult(name, dpack_gen.target, dpack_gen.file_count, dpack_gen.size, time.perf_counter() - start,
+                       dpack_gen.records)
+
+
+def batch(in_folder: str, out_path: str, gs: GenerationSettings = None) -> List[BuildResult]:
+    """
+    Compile every datapack folder in in_folder in this process. The packs share a process pool and the module cache
+    entries already in memory, and a pack that fails to compile doesn't stop the rest
+    :return: the result of every pack
+    """
+    gs = gs or GenerationSettings()
+    results = []
+    memory = {}
+
+    executor = ProcessPoolExecutor(gs.jobs) if gs.jobs > 1 else None
+    try:
+        for name in sorted(os.listdir(in_folder)):
+            in_path = os.path.join(in_folder, name)
+            if not os.path.isdir(in_path):
+                continue
+
+            start = time.perf_counter()
+            try:
+                results.append(build(in_path, out_path, gs, executor, memory))
+            except SystemExit:
+                # error.doc_error has already printed what went wrong
+                results.append(BuildResult(name, None, 0, 0, time.perf_counter() - start, [], False))
+            except Exception:
+                traceback.print_exc()
+                results.append(BuildResult(name, None, 0, 0, time.perf_counter() - start, [], False))
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    dpack_gen = DatapackGenerator(gs)
-    dpack_gen.generate(dp_folder, namespaces)
+    for result in results:
+        if result.ok:
+            msg = "{}: {} files ({} bytes) in {:.2f}s"
+            print(msg.format(result.name, result.file_count, result.size, result.seconds))
+        else:
+            print("{}: failed".format(result.name))
 
+    return results
 
-class GenerationSettings:
-    def __init__(self, argv):
-        self.debug = "DEBUG" in argv
-        self.warn_fail = "NOFAIL" not in argv
-        self.comment = "NOCOMMENT" not in argv
 
+# Guarded so worker processes that re-import this file don't start their own build
+if __name__ == "__main__":
+    settings = GenerationSettings.from_argv(sys.argv)
 
-comp(sys.argv[1],
-     sys.argv[2],
-     GenerationSettings(sys.argv))
+    if sys.argv[1] == "watch":
+        watch(sys.argv[2], sys.argv[3], settings)
+    elif sys.argv[1] == "batch":
+        if not all(result.ok for result in batch(sys.argv[2], sys.argv[3], settings)):
+            sys.exit(1)
+    else:
+        build(sys.argv[1], sys.argv[2], settings)
@@ -1,76 +1,232 @@
-import os
 import shutil
 from collections import OrderedDict
 from typing import List
 
-from containers import ILNamespace, ILBlock
-from vm import StackIndex
+from containers import ILNamespace, ILModule, ILBlock
+from instrs import Comment, Mark, BLOCK_LINKS
+from output import OutputTree, FolderSink, SyncSink, ZipSink, write_file, sync_file
+from passes import PassManager
+from vm import StackIndex, use_layout
 import json
 
 
 class DatapackGenerator:
-    def __init__(self, gs):
+    def __init__(self, gs, cache=None):
         self.gs = gs
-        self.stack_histories = OrderedDict()
-        self.files_made = set()
+        self.cache = cache
+        self.records = []  # PassRecords of every pass run to make the datapack, when profiling
 
-    def generate(self, dp_folder: str, namespaces: List[ILNamespace]):
-        if not os.path.exists(dp_folder):
-            os.makedirs(dp_folder)
+        # What was written, once the datapack has been flushed
+        self.target = None
+        self.file_count = 0
+        self.size = 0
+
+        # Source and source positions of every mcfunction, by file name, when making a source map
+        self.source_map = OrderedDict()
 
-        with open(dp_folder + "pack.mcmeta", "w+") as f:
-            json.dump({
-                "pack": {
-                    "pack_format": 3,
-                    "description": ""
-                }
-            }, f)
+    def generate(self, dp_folder: str, namespaces: List[ILNamespace]):
+        tree = self.new_tree()
 
         for namespace in namespaces:
-            shutil.rmtree(dp_folder + namespace.path.file(), ignore_errors=True)
             for module in namespace.modules:
-                print()
-                print(module.source_path)
-                for frame in module.frames:
-
-                    si = StackIndex(-1)
-
-                    self.generate_block(frame.root_block, dp_folder, si)
-
-                    if si.index != -1:
-                        stack_detail = ""
-                        for file, hist in list(self.stack_histories.items()):
-                            lines = [file]
-                            lines.extend(["{}{}".format("|" * (i + 1), instr.str()[0]) for instr, i in hist])
-                            stack_detail += "\n\n" + "\n".join(lines)
-                        msg = "WARNING: Alloy has compiled the stack to an invalid state ({})\n{}"
-                        raise Exception(msg.format(si.index, stack_detail))
-
-                    self.stack_histories = OrderedDict()
-
-    def generate_block(self, block: ILBlock, dp_folder, si: StackIndex):
-        file_name = dp_folder + block.path.file() + ".mcfunction"
-
-        folder_path = os.path.dirname(file_name)
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-
-        # print()
-        # print(file_name)
-        if file_name in self.files_made:
-            raise Exception("{} has already been created".format(file_name))
-        self.files_made.add(file_name)
-
-        self.stack_histories[file_name] = []
-        print("  " + file_name)
-        with open(file_name, "w+") as output:
+                for file_name, text in self.module_files(module, dp_folder).items():
+                    tree.write(file_name, text)
+
+        passes = PassManager(self.gs, "datapack", self.records)
+        passes.run("flush", self.flush, tree, dp_folder, namespaces)
+
+        if self.gs.source_map:
+            self.write_source_map(dp_folder)
+
+    def stream(self, dp_folder: str, namespace_paths: list, modules):
+        """
+        Generate and write out modules one at a time as they are assembled, so only one module's IL and files are in
+        memory at once
+        :param namespace_paths: paths of every namespace the modules are in
+        :param modules: iterable that assembles each module when it is asked for the next
+        """
+        sink = self.new_sink(dp_folder, namespace_paths)
+
+        for file_name, text in self.new_tree().files.items():
+            sink.write(file_name, text)
+
+        for module in modules:
+            for file_name, text in self.module_files(module, dp_folder).items():
+                sink.write(file_name, text)
+            del module  # Free the module before the next one is assembled
+
+        passes = PassManager(self.gs, "datapack", self.records)
+        passes.run("flush", sink.close)
+
+        if self.gs.source_map:
+            self.write_source_map(dp_folder)
+
+        self.target = sink.zip_path if isinstance(sink, ZipSink) else dp_folder
+        self.file_count = len(sink.names)
+        self.size = sink.size
+
+        if isinstance(sink, SyncSink):
+            print("{} changed, {} unchanged, {} removed".format(sink.changed, sink.unchanged, sink.removed))
+        elif self.gs.quiet:
+            print("Wrote {} files ({} bytes) to {}".format(self.file_count, self.size, self.target))
+
+    def new_sink(self, dp_folder: str, namespace_paths: list):
+        """
+        Make a sink that writes the datapack out as a zip, by syncing only changed files, or by replacing every
+        namespace folder, like flush does for a whole tree
+        """
+        if self.gs.zip:
+            return ZipSink(dp_folder.rstrip("/") + ".zip", self.gs.zip_level)
+        if self.gs.diff:
+            return SyncSink(dp_folder, [path.file() for path in namespace_paths])
+
+        for path in namespace_paths:
+            shutil.rmtree(dp_folder + path.file(), ignore_errors=True)
+        return FolderSink(dp_folder)
+
+    def module_files(self, module: ILModule, dp_folder: str) -> OrderedDict:
+        """
+        Get the mcfunctions of a module, from the cache if it was loaded from there, or by generating them
+        """
+        if not self.gs.quiet:
+            print()
+            print(module.source_path)
+
+        if module.files is not None:
+            files = module.files
+        else:
+            passes = PassManager(self.gs, str(module.path), module.profile)
+            files = passes.run("generate", self.generate_module, module)
+            if self.cache is not None:
+                self.cache.store(module.path, module.key, files, module.source_map)
+
+        if not self.gs.quiet:
+            for file_name in files:
+                print("  " + dp_folder + file_name)
+            for name, removed in module.removed.items():
+                print("  {} removed {} commands".format(name, removed))
+
+        if self.gs.source_map:
+            for file_name, mappings in module.source_map.items():
+                self.source_map[file_name] = {"source": module.source_path, "mappings": mappings}
+
+        self.records.extend(module.profile)
+        return files
+
+    @staticmethod
+    def new_tree() -> OutputTree:
+        """
+        Make an output tree holding only the pack.mcmeta
+        """
+        tree = OutputTree()
+
+        tree.write("pack.mcmeta", json.dumps({
+            "pack": {
+                "pack_format": 3,
+                "description": ""
+            }
+        }))
+
+        return tree
+
+    def flush(self, tree: OutputTree, dp_folder: str, namespaces: List[ILNamespace]):
+        """
+        Write the generated datapack out as a zip, by syncing only changed files, or by replacing every namespace folder
+        """
+        if self.gs.zip:
+            target = dp_folder.rstrip("/") + ".zip"
+            tree.flush_zip(target, self.gs.zip_level)
+        elif self.gs.diff:
+            target = dp_folder
+            owned = [namespace.path.file() for namespace in namespaces]
+            changed, unchanged, removed = tree.sync(dp_folder, owned, self.gs.threads)
+            print("{} changed, {} unchanged, {} removed".format(changed, unchanged, removed))
+        else:
+            target = dp_folder
+            for namespace in namespaces:
+                shutil.rmtree(dp_folder + namespace.path.file(), ignore_errors=True)
+            tree.flush(dp_folder, self.gs.threads)
+
+        self.target = target
+        self.file_count = len(tree.files)
+        self.size = tree.size()
+
+        if self.gs.quiet and not self.gs.diff:
+            print("Wrote {} files ({} bytes) to {}".format(self.file_count, self.size, self.target))
+
+    def generate_module(self, module: ILModule) -> OrderedDict:
+        """
+        Generate the mcfunctions of every frame in a module
+        :return: the text of each mcfunction, by file name relative to the datapack folder
+        """
+        files = OrderedDict()
+        source_map = OrderedDict() if self.gs.source_map else None
+
+        # The stack of every frame has been checked by the verifier when it was assembled
+        with use_layout(self.gs):
+            for frame in module.frames:
+                self.generate_block(frame.root_block, files, StackIndex(-1), source_map)
+
+        module.source_map = source_map
+        return files
+
+    def generate_block(self, block: ILBlock, files: OrderedDict, si: StackIndex, source_map: OrderedDict = None):
+        """
+        Generate a block and every block it targets. Each target starts from the stack index its parent was on when it
+        linked to it
+        :param source_map: if given, the source position of the commands in each file are added to it. Each position is
+        [index of its first command in the file, source line, bytecode offset], and holds until the next position.
+        Comments, and the debug and failure reports indented after each command, aren't commands
+        """
+        # Worklist instead of recursion, so deeply nested blocks don't hit the recursion limit
+        work = [(block, si)]
+        while work:
+            block, si = work.pop()
+            file_name = block.path.file() + ".mcfunction"
+
+            # print()
+            # print(file_name)
+            if file_name in files:
+                raise Exception("{} has already been created".format(file_name))
+
+            output = []
+            commands = 0
+            mappings = []
+            position = None
+            starts = {}  # Stack index of each link to a target
             for instr in block.instrs:
                 # print(instr)
-                for command in instr.generate(si, self.gs):
-                    output.write(command + "\n")
-
-                self.stack_histories[file_name].append((instr, si.index))
+                if type(instr) in BLOCK_LINKS:
+                    starts[instr.path] = si.index
+                if source_map is not None and isinstance(instr, (Comment, Mark)) and instr.line is not None:
+                    position = [instr.line, getattr(instr, "offset", None)]
 
-        for b in block.targets:
-            si2 = StackIndex(si.index)
-            self.generate_block(b, dp_folder, si2)
+                for command in instr.generate(si, self.gs):
+                    if command.startswith("#") or command.startswith(" "):
+                        output.append(command + "\n")
+                        continue
+
+                    if position is not None and (not mappings or mappings[-1][1:] != position):
+                        mappings.append([commands] + position)
+                    commands += 1
+                    output.append(command + "\n")
+
+            files[file_name] = "".join(output)
+            if source_map is not None:
+                source_map[file_name] = mappings
+
+            # Reversed, so targets are popped and generated in order
+            for b in reversed(block.targets):
+                work.append((b, StackIndex(starts.get(b.path, si.index))))
+
+    def write_source_map(self, dp_folder: str):
+        """
+        Write the source map next to the datapack, as <datapack>.sourcemap.json
+        """
+        path = dp_folder.rstrip("/") + ".sourcemap.json"
+        text = json.dumps({"version": 1, "files": self.source_map}, separators=(",", ":"))
+
+        if self.gs.diff:
+            sync_file(path, text)
+        else:
+            write_file(path, text)
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import zipfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Every zip entry gets the same timestamp, so building the same pack twice gives the same archive
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class OutputTree:
+    def __init__(self):
+        """
+        In memory map of every file in the datapack, by path relative to the datapack folder.
+        Nothing touches the disk until it is flushed
+        """
+        self.files = OrderedDict()
+
+    def write(self, file_name: str, text: str):
+        if file_name in self.files:
+            raise Exception("{} has already been created".format(file_name))
+        self.files[file_name] = text
+
+    def size(self) -> int:
+        return sum(len(text.encode()) for text in self.files.values())
+
+    def flush(self, folder: str, threads: int):
+        """
+        Write every file to folder. Folders are all made up front, then files are written by a pool of threads
+        """
+        for path in sorted({os.path.dirname(os.path.join(folder, name)) for name in self.files}):
+            os.makedirs(path, exist_ok=True)
+
+        with ThreadPoolExecutor(threads) as executor:
+            # list() so any exception raised while writing is raised here
+            list(executor.map(lambda item: write_file(os.path.join(folder, item[0]), item[1]), self.files.items()))
+
+    def sync(self, folder: str, owned: list, threads: int):
+        """
+        Write only the files whose content differs from what is already in folder, and delete the stale files in owned
+        folders that are no longer generated. Unchanged files keep their mtime, so rsync and reload watchers skip them
+        :param owned: folders relative to folder that only hold generated files
+        :return: counts of changed, unchanged and removed files
+        """
+        for path in sorted({os.path.dirname(os.path.join(folder, name)) for name in self.files}):
+            os.makedirs(path, exist_ok=True)
+
+        with ThreadPoolExecutor(threads) as executor:
+            changed = list(executor.map(lambda item: sync_file(os.path.join(folder, item[0]), item[1]),
+                                        self.files.items()))
+
+        removed = remove_stale(folder, owned, self.files)
+        return changed.count(True), changed.count(False), removed
+
+    def flush_zip(self, zip_path: str, compress_level=None):
+        """
+        Write every file into a zip archive that Minecraft can load as a datapack, without writing the files to disk
+        :param compress_level: deflate level 1-9, None for zlib's default, or 0 to store the files uncompressed
+        """
+        sink = ZipSink(zip_path, compress_level)
+        for name in sorted(self.files):
+            sink.write(name, self.files[name])
+        sink.close()
+
+
+class Sink(ABC):
+    def __init__(self):
+        """
+        Takes the files of the datapack one at a time as they are generated, so they don't all have to be kept in memory
+        """
+        self.names = set()
+        self.size = 0
+
+    def write(self, file_name: str, text: str):
+        if file_name in self.names:
+            raise Exception("{} has already been created".format(file_name))
+        self.names.add(file_name)
+        self.size += len(text.encode())
+        self.put(file_name, text)
+
+    @abstractmethod
+    def put(self, file_name: str, text: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class FolderSink(Sink):
+    def __init__(self, folder: str):
+        """
+        Write each file into folder as soon as it is generated
+        """
+        super().__init__()
+        self.folder = folder
+
+    def put(self, file_name, text):
+        file_path = os.path.join(self.folder, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        write_file(file_path, text)
+
+
+class SyncSink(FolderSink):
+    def __init__(self, folder: str, owned: list):
+        """
+        Write each file into folder unless it already holds the same text, and delete the stale files in owned folders
+        once every file has been written
+        :param owned: folders relative to folder that only hold generated files
+        """
+        super().__init__(folder)
+        self.owned = owned
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def put(self, file_name, text):
+        file_path = os.path.join(self.folder, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if sync_file(file_path, text):
+            self.changed += 1
+        else:
+            self.unchanged += 1
+
+    def close(self):
+        self.removed = remove_stale(self.folder, self.owned, self.names)
+
+
+class ZipSink(Sink):
+    def __init__(self, zip_path: str, compress_level=None):
+        """
+        Write each file into a zip archive as soon as it is generated. The archive replaces zip_path when closed
+        :param compress_level: deflate level 1-9, None for zlib's default, or 0 to store the files uncompressed
+        """
+        super().__init__()
+        self.zip_path = zip_path
+        self.compress_level = compress_level
+        self.compress_type = zipfile.ZIP_STORED if compress_level == 0 else zipfile.ZIP_DEFLATED
+
+        folder = os.path.dirname(zip_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.archive = zipfile.ZipFile(zip_path + ".tmp", "w", self.compress_type)
+
+    def put(self, file_name, text):
+        info = zipfile.ZipInfo(file_name, ZIP_DATE_TIME)
+        info.external_attr = 0o644 << 16
+        info.compress_type = self.compress_type
+        if self.compress_level:
+            # Only Python 3.7 and later take a level, from_argv rejects --zip-level before that
+            self.archive.writestr(info, text, compresslevel=self.compress_level)
+        else:
+            self.archive.writestr(info, text)
+
+    def close(self):
+        self.archive.close()
+        os.replace(self.zip_path + ".tmp", self.zip_path)
+
+
+def remove_stale(folder: str, owned: list, names) -> int:
+    """
+    Delete every file in the owned folders that isn't one of names, and the folders left empty
+    :return: how many files were deleted
+    """
+    removed = 0
+    expected = {os.path.normpath(os.path.join(folder, name)) for name in names}
+    for owned_folder in owned:
+        for path, dirs, files in os.walk(os.path.join(folder, owned_folder), topdown=False):
+            for file in sorted(files):
+                file_name = os.path.normpath(os.path.join(path, file))
+                if file_name not in expected:
+                    os.remove(file_name)
+                    removed += 1
+            if not os.listdir(path):
+                os.rmdir(path)
+
+    return removed
+
+
+def write_file(file_name: str, text: str):
+    with open(file_name, "w+") as f:
+        f.write(text)
+
+
+def sync_file(file_name: str, text: str) -> bool:
+    """
+    Write text to file_name unless it already holds exactly that text
+    :return: True if the file was written
+    """
+    data = text.encode()
+    try:
+        with open(file_name, "rb") as f:
+            if hashlib.sha1(f.read()).digest() == hashlib.sha1(data).digest():
+                return False
+    except FileNotFoundError:
+        pass
+
+    with open(file_name, "wb") as f:
+        f.write(data)
+    return True
@@ -0,0 +1,123 @@
+import ast
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from alloy import nodes
+from containers import ILModule
+
+
+class PassRecord:
+    def __init__(self, unit: str, name: str, seconds: float, peak: int, counts: tuple):
+        """
+        What one pass cost when run over one module
+        :param unit: the module the pass ran over
+        :param seconds: wall time of the pass
+        :param peak: peak bytes allocated while the pass ran, None when not tracing memory
+        :param counts: blocks, instructions and commands in the pass's output, None where they don't apply
+        """
+        self.unit = unit
+        self.name = name
+        self.seconds = seconds
+        self.peak = peak
+        self.blocks, self.instrs, self.commands = counts
+
+
+class PassManager:
+    def __init__(self, gs, unit: str, records: list = None):
+        """
+        Runs the stages of the compiler as named passes over a module, and records what each one cost
+        :param unit: name of the module the passes run over
+        :param records: list to add records to, so the passes of a module can be run by more than one manager
+        """
+        self.gs = gs
+        self.unit = unit
+        self.records = records if records is not None else []
+
+    def run(self, name: str, func, *args):
+        """
+        Run func(*args) as the pass name
+        :return: whatever func returns
+        """
+        if not self.gs.profile:
+            return func(*args)
+
+        # Only trace allocations here if nothing else is already tracing them
+        trace = self.gs.profile_memory and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+
+        peak = tracemalloc.get_traced_memory()[1] if self.gs.profile_memory else None
+        if trace:
+            tracemalloc.stop()
+
+        self.records.append(PassRecord(self.unit, name, seconds, peak, count(result)))
+        return result
+
+
+def count(result) -> tuple:
+    """
+    Count the blocks, instructions and commands in the output of a pass
+    """
+    if isinstance(result, ast.AST):
+        return None, sum(isinstance(n, ast.stmt) for n in ast.walk(result)), None
+
+    if isinstance(result, nodes.Module):
+        blocks = [b for frame in result.frames for b in alloy_blocks(frame.root_block)]
+        return len(blocks), sum(len(b.body) for b in blocks), None
+
+    if isinstance(result, ILModule):
+        if result.files is not None:
+            return count(result.files)
+        blocks = [b for frame in result.frames for b in frame.blocks()]
+        return len(blocks), sum(len(b.instrs) for b in blocks), None
+
+    if isinstance(result, dict):
+        commands = sum(1 for text in result.values() for line in text.split("\n")
+                       if line and not line.startswith("#"))
+        return len(result), None, commands
+
+    return None, None, None
+
+
+def alloy_blocks(block: nodes.Block):
+    work = [block]
+    while work:
+        block = work.pop()
+        yield block
+        work.extend(link.block for link in block.links if link.block is not None)
+
+
+def report(records: list, file=sys.stdout):
+    """
+    Print the cost of every pass over every module, followed by the total of each pass
+    """
+    totals = OrderedDict()
+    for record in records:
+        total = totals.setdefault(record.name, PassRecord("total", record.name, 0, None, (None, None, None)))
+        total.seconds += record.seconds
+        if record.peak is not None:
+            total.peak = max(total.peak or 0, record.peak)
+        for attr in ["blocks", "instrs", "commands"]:
+            if getattr(record, attr) is not None:
+                setattr(total, attr, (getattr(total, attr) or 0) + getattr(record, attr))
+
+    rows = list(records) + list(totals.values())
+    width = max([len("module")] + [len(r.unit) for r in rows])
+    fmt = "{:<" + str(width) + "}  {:<10} {:>10} {:>10} {:>7} {:>7} {:>9}"
+
+    def num(value):
+        return "-" if value is None else str(value)
+
+    print(fmt.format("module", "pass", "time (ms)", "peak (KiB)", "blocks", "instrs", "commands"), file=file)
+    for i, r in enumerate(rows):
+        if i == len(records):
+            print(file=file)
+        peak = "-" if r.peak is None else "{:.1f}".format(r.peak / 1024)
+        print(fmt.format(r.unit, r.name, "{:.2f}".format(r.seconds * 1000), peak,
+                         num(r.blocks), num(r.instrs), num(r.commands)), file=file)
@@ -0,0 +1,164 @@
+import sys
+
+import error
+
+
+class GenerationSettings:
+    def __init__(self, debug=False, warn_fail=True, comment=True, cache=False, jobs=1, slice_bytecode=False,
+                 quiet=False, threads=8, zip=False, zip_level=None, diff=False, profile=False, profile_memory=False,
+                 stream=False, source_map=False, scores=False, peephole=False, fold=False,
+                 dce=False, merge=False, inline=False, inline_size=32, pool=0,
+                 storage=False, marker=False, passenger=False):
+        """
+        Everything that changes how a datapack is built. The defaults match running mcalloy.py without any flags
+        :param debug: add commands that print every instruction as it runs (DEBUG)
+        :param warn_fail: add commands that report commands that fail (on unless NOFAIL)
+        :param comment: comment the generated mcfunctions (on unless NOCOMMENT)
+        :param cache: reuse the output of modules that haven't changed since the last build, kept in .mcalloy_cache next
+        to the datapacks folder (CACHE)
+        :param jobs: number of processes to assemble modules on (--jobs N)
+        :param slice_bytecode: take statement bytecode from the frame's code object (SLICE)
+        :param quiet: only print a summary of the build (QUIET)
+        :param threads: number of threads to write files with (--threads N)
+        :param zip: write the datapack as a zip archive (ZIP)
+        :param zip_level: compression level of the zip archive (--zip-level N)
+        :param diff: only write files that changed (DIFF)
+        :param profile: report the cost of every pass (--profile, or --profile-time for timing only)
+        :param profile_memory: trace allocations while profiling, which slows the compiler down (--profile)
+        :param stream: assemble, emit and free modules one at a time (STREAM)
+        :param source_map: write a map from every generated command back to its source next to the datapack (SOURCEMAP)
+        :param scores: keep int locals in the __r0__, __r1__... scores of the frame's entity instead of NBT, the
+        objectives have to exist like __asm__ does (SCORES)
+        :param peephole: remove and fuse instructions that move values through the stack for nothing (PEEPHOLE)
+        :param fold: fold int constants, propagate them through names, and drop branches that can't run (FOLD)
+        :param dce: drop blocks that can't run or are empty, and frames of functions that are never loaded (DCE)
+        :param merge: move the commands of bridged blocks into the block bridging to them, where ret can't be set
+        (MERGE)
+        :param inline: replace calls of module level functions decorated with @embed, or at most inline_size nodes big
+        without direct commands, with their bodies (INLINE)
+        :param inline_size: largest function inlined without @embed, in AST nodes of its body (--inline-size N)
+        :param pool: keep up to pool frame entities released by calls tagged __free__, and have calls reuse them instead
+        of summoning new ones, 0 for none (--pool N)
+        :param storage: keep the call stack as a list of frames in data storage instead of on armor stands, which leaves
+        no entity for scores, the pool or passengers to use. Direct commands are left as written (STORAGE)
+        :param marker: summon markers for frames and objects instead of armor stands, with their data in the data
+        compound of the marker rather than ArmorItems[0].tag. Direct commands are left as written (MARKER)
+        :param passenger: mount the frame of each call on its caller, so they reach each other as passenger and vehicle
+        instead of by searching every entity for a tag. Markers can't be ridden, and taking frames from the pool
+        searches every entity, so it can't be used with either (PASSENGER)
+        """
+        self.debug = debug
+        self.warn_fail = warn_fail
+        self.comment = comment
+        self.cache = cache
+        self.jobs = jobs
+        self.slice_bytecode = slice_bytecode
+        self.quiet = quiet
+        self.threads = threads
+        self.zip = zip
+        self.zip_level = zip_level
+        self.diff = diff
+        self.profile = profile
+        self.profile_memory = profile_memory
+        self.stream = stream
+        self.source_map = source_map
+        self.scores = scores
+        self.peephole = peephole
+        self.fold = fold
+        self.dce = dce
+        self.merge = merge
+        self.inline = inline
+        self.inline_size = inline_size
+        self.pool = pool
+        self.storage = storage
+        self.marker = marker
+        self.passenger = passenger
+
+    @classmethod
+    def from_argv(cls, argv):
+        """
+        Read settings from command line arguments, like ["DEBUG", "--jobs", "4"]
+        """
+        zip_level = cls.int_option(argv, "--zip-level", None)
+        if zip_level and sys.version_info < (3, 7):
+            error.usage_error("--zip-level needs Python 3.7 or later, leave it out for zlib's default level")
+
+        pool = cls.int_option(argv, "--pool", 0)
+        storage = "STORAGE" in argv
+        passenger = "PASSENGER" in argv
+        conflicts = [
+            (storage and "SCORES" in argv, "SCORES keeps locals on frame entities, which STORAGE doesn't have"),
+            (storage and pool, "--pool keeps frame entities, which STORAGE doesn't have"),
+            (storage and passenger, "PASSENGER mounts frame entities, which STORAGE doesn't have"),
+            (passenger and "MARKER" in argv, "PASSENGER can't mount frames on markers, leave out MARKER"),
+            (passenger and pool, "PASSENGER can't take frames from the pool, leave out --pool")
+        ]
+        for conflict, msg in conflicts:
+            if conflict:
+                error.usage_error(msg)
+
+        return cls(
+            debug="DEBUG" in argv,
+            warn_fail="NOFAIL" not in argv,
+            comment="NOCOMMENT" not in argv,
+            cache="CACHE" in argv,
+            jobs=cls.int_option(argv, "--jobs", 1),
+            slice_bytecode="SLICE" in argv,
+            quiet="QUIET" in argv,
+            threads=cls.int_option(argv, "--threads", 8),
+            zip="ZIP" in argv,
+            zip_level=zip_level,
+            diff="DIFF" in argv,
+            profile="--profile" in argv or "--profile-time" in argv,
+            profile_memory="--profile" in argv,
+            stream="STREAM" in argv,
+            source_map="SOURCEMAP" in argv,
+            scores="SCORES" in argv,
+            peephole="PEEPHOLE" in argv,
+            fold="FOLD" in argv,
+            dce="DCE" in argv,
+            merge="MERGE" in argv,
+            inline="INLINE" in argv,
+            inline_size=cls.int_option(argv, "--inline-size", 32),
+            pool=pool,
+            storage=storage,
+            marker="MARKER" in argv,
+            passenger=passenger
+        )
+
+    def key(self) -> str:
+        """
+        Describes every setting that changes the generated commands, used to key cached module output
+        """
+        return "debug={} warn_fail={} comment={} slice={} source_map={} scores={} peephole={} fold={} dce={} " \
+               "merge={} inline={} pool={} storage={} marker={} passenger={}".format(
+                   self.debug, self.warn_fail, self.comment, self.slice_bytecode, self.source_map, self.scores,
+                   self.peephole, self.fold, self.dce, self.merge, self.inline and self.inline_size, self.pool,
+                   self.storage, self.marker, self.passenger)
+
+    @staticmethod
+    def option(argv, name, default):
+        """
+        Get the value following name in argv, for options like --jobs 4
+        """
+        if name not in argv:
+            return default
+
+        index = argv.index(name) + 1
+        if index == len(argv):
+            error.usage_error("{} needs a value".format(name))
+        return argv[index]
+
+    @classmethod
+    def int_option(cls, argv, name, default):
+        """
+        Get the int following name in argv
+        """
+        value = cls.option(argv, name, default)
+        if value is None or isinstance(value, int):
+            return value
+
+        try:
+            return int(value)
+        except ValueError:
+            error.usage_error("{} needs a whole number, not {}".format(name, value))
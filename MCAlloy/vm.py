@@ -1,13 +1,114 @@
+import contextlib
+
+# Storage that holds the call stack with the storage backend, a list of frame compounds with the running frame last
+STORAGE = "mcalloy:vm"
+
+
+class Layout:
+    current = None  # What commands are generated for, see use_layout
+
+    def __init__(self, storage=False, marker=False):
+        """
+        Where the VM keeps the data of its frames, and what it summons for them
+        :param storage: in the compounds of the Frames list in storage, with the running frame last, instead of in the
+        NBT of the entity each frame runs as
+        :param marker: summon markers for frames and objects, with their data in the data compound of the marker,
+        instead of armor stands with it in the tag of a paper item
+        """
+        self.storage = storage
+        self.marker = marker
+        self.entity = "minecraft:marker" if marker else "minecraft:armor_stand"
+        self.root = "data" if marker else "ArmorItems[0].tag"
+
+    def frame(self, depth=1) -> str:
+        """
+        NBT source holding the data of the frame depth frames from the top of the call stack. Only frames in storage can
+        be reached below the running one, which is @s otherwise
+        """
+        if self.storage:
+            return "storage {} Frames[-{}]".format(STORAGE, depth)
+        return "entity @s " + self.root
+
+    def text(self, path="") -> str:
+        """
+        Json text component showing path in the data of the running frame
+        """
+        if self.storage:
+            return '{{"nbt":"Frames[-1]{}","storage":"{}"}}'.format(path, STORAGE)
+        return '{{"nbt":"{}{}","entity":"@s"}}'.format(self.root, path)
+
+    def select(self, filters: str) -> str:
+        """
+        Selector of the entities the VM summoned that match filters, like tag=__dest__,limit=1
+        """
+        if self.marker:
+            return "@e[type={},{}]".format(self.entity, filters)
+        return "@e[{}]".format(filters)
+
+    def summon(self, position: str, tags: list, data: str = None) -> str:
+        """
+        Command summoning a frame or object at position, holding data if given
+        """
+        nbt = "Tags:[{}]".format(", ".join('"{}"'.format(tag) for tag in tags))
+        if data is not None:
+            nbt += ",{}:{}".format(*self.data(data))
+        return "summon {} {} {{{}}}".format(self.entity, position, nbt)
+
+    def reset(self, selector: str, data: str) -> str:
+        """
+        Command replacing everything selector holds with data, in a single write
+        """
+        return "data modify entity {} {} set value {}".format(selector, *self.data(data))
+
+    def data(self, data: str) -> tuple:
+        # The tag of the entity that holds the data, and its value
+        if self.marker:
+            return "data", data
+        return "ArmorItems", '[{id:"minecraft:paper",Count:1b,tag:' + data + '},{},{},{}]'
+
+
+Layout.current = Layout()
+
+
+def layout() -> Layout:
+    return Layout.current
+
+
+@contextlib.contextmanager
+def use_layout(gs):
+    """
+    Generate commands for the layout gs builds with while in this context, and for the default one after it
+    """
+    previous = Layout.current
+    Layout.current = Layout(gs.storage, gs.marker)
+    try:
+        yield Layout.current
+    finally:
+        Layout.current = previous
 
 
 class VMIndex:
+    __slots__ = ("index",)
     nbt = None
 
     def __init__(self, index):
         self.index = index
 
     def __repr__(self):
-        return "ArmorItems[0].tag.{}".format(self.nbt.format(self.index))
+        # NBT source of this index in the running frame
+        return self.frame()
+
+    def frame(self, depth=1) -> str:
+        """
+        NBT source of this index in the frame depth frames from the top of the call stack
+        """
+        return "{}.{}".format(layout().frame(depth), self.nbt.format(self.index))
+
+    def on(self, selector) -> str:
+        """
+        NBT source of this index in the frame selector runs as, like the one a call is about to run
+        """
+        return "entity {} {}.{}".format(selector, layout().root, self.nbt.format(self.index))
 
     def __str__(self):
         # Very often I would use str() instead of repr() on a VMIndex before using it in a command,
@@ -17,10 +118,12 @@ class VMIndex:
 
 
 class ConstIndex(VMIndex):
+    __slots__ = ()
     nbt = "Consts[{}]"
 
 
 class StackIndex(VMIndex):
+    __slots__ = ()
     nbt = "Stack[{}]"
 
     def off(self, offset):
@@ -37,8 +140,19 @@ class StackIndex(VMIndex):
 
 
 class PreIndex(VMIndex):
+    __slots__ = ()
     nbt = "Pre[{}]"
 
 
 class NameIndex(VMIndex):
+    __slots__ = ()
     nbt = "Names.{}"
+
+
+class ScoreIndex(VMIndex):
+    __slots__ = ()
+    nbt = "__r{}__"
+
+    def __repr__(self):
+        # A score of the frame's entity, rather than a path in its NBT
+        return "@s " + self.nbt.format(self.index)
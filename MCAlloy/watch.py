@@ -0,0 +1,147 @@
+import os
+import time
+import traceback
+from collections import OrderedDict
+
+import error
+from assembler.module import ILModuleGenerator
+from containers import Path
+from mcgen import DatapackGenerator
+from output import write_file
+
+
+def watch(in_path, out_path, gs, interval=0.5):
+    # Only the changed files of the datapack folder are rewritten, there is no archive or source map to keep up to date
+    if gs.zip:
+        error.usage_error("watch writes a datapack folder, leave out ZIP")
+    if gs.source_map:
+        error.usage_error("watch doesn't write a source map, leave out SOURCEMAP")
+
+    watcher = Watcher(in_path, out_path, gs)
+    watcher.build()
+    print("Watching {} for changes, Ctrl+C to stop".format(in_path))
+
+    try:
+        while True:
+            time.sleep(interval)
+            watcher.update()
+    except KeyboardInterrupt:
+        pass
+
+
+class WatchedModule:
+    def __init__(self, stamp, gen: ILModuleGenerator, files: OrderedDict):
+        """
+        Everything the watcher remembers about one module between builds
+        :param stamp: mtime and size of the source when it was compiled
+        :param gen: the generator, holding the module's source, AST, Alloy and IL
+        :param files: the mcfunctions generated from the module, as they are on disk
+        """
+        self.stamp = stamp
+        self.gen = gen
+        self.files = files
+
+
+class Watcher:
+    def __init__(self, in_path, out_path, gs):
+        """
+        Keeps a datapack compiled in memory, and recompiles only the modules whose source changes
+        """
+        self.in_path = in_path
+        self.gs = gs
+        self.name = os.path.basename(os.path.normpath(in_path))
+        self.dp_folder = "{}/datapacks/{}/".format(out_path, self.name)
+        self.dpack_gen = DatapackGenerator(gs)
+        self.modules = OrderedDict()
+
+    def scan(self) -> OrderedDict:
+        """
+        Find every module in the input folder
+        :return: (namespace path, module name, stamp) by module file path
+        """
+        found = OrderedDict()
+        for namespace in sorted(os.listdir(self.in_path)):
+            ns_path = os.path.join(self.in_path, namespace)
+            for file in sorted(os.listdir(ns_path)):
+                mod_file_path = os.path.join(ns_path, file)
+                stat = os.stat(mod_file_path)
+                mod_name = os.path.splitext(file)[0]
+                found[mod_file_path] = (Path(namespace=namespace), mod_name, (stat.st_mtime_ns, stat.st_size))
+        return found
+
+    def compile(self, mod_file_path, ns_path, mod_name, stamp):
+        """
+        Compile a module, on failure the module is remembered with no output so it isn't retried until it changes
+        """
+        gen = ILModuleGenerator(ns_path, mod_file_path, mod_name, self.gs)
+        try:
+            module = gen.assemble()
+            files = self.dpack_gen.generate_module(module)
+        except SystemExit:
+            # error.doc_error has already printed what went wrong
+            return WatchedModule(stamp, gen, None)
+        except Exception:
+            traceback.print_exc()
+            return WatchedModule(stamp, gen, None)
+
+        return WatchedModule(stamp, gen, files)
+
+    def build(self):
+        """
+        Compile every module, and sync the whole datapack with what is on disk
+        """
+        found = self.scan()
+        for mod_file_path, (ns_path, mod_name, stamp) in found.items():
+            self.modules[mod_file_path] = self.compile(mod_file_path, ns_path, mod_name, stamp)
+
+        tree = self.dpack_gen.new_tree()
+        for watched in self.modules.values():
+            for file_name, text in (watched.files or {}).items():
+                tree.write(file_name, text)
+
+        owned = sorted({ns_path.file() for ns_path, mod_name, stamp in found.values()})
+        changed, unchanged, removed = tree.sync(self.dp_folder, owned, self.gs.threads)
+        print("{} changed, {} unchanged, {} removed".format(changed, unchanged, removed))
+
+    def update(self):
+        """
+        Recompile the modules that changed since the last update, and write only the files that changed because of it
+        """
+        found = self.scan()
+
+        for mod_file_path, (ns_path, mod_name, stamp) in found.items():
+            old = self.modules.get(mod_file_path)
+            if old is not None and old.stamp == stamp:
+                continue
+
+            start = time.perf_counter()
+            new = self.compile(mod_file_path, ns_path, mod_name, stamp)
+
+            if new.files is None:
+                # Keep the last good output on disk until the module is fixed
+                if old is not None and old.files is not None:
+                    new.files = old.files
+                self.modules[mod_file_path] = new
+                continue
+
+            self.write_changes(old.files if old and old.files else {}, new.files)
+            self.modules[mod_file_path] = new
+            print("{} recompiled in {:.3f}s".format(mod_file_path, time.perf_counter() - start))
+
+        for mod_file_path in [p for p in self.modules if p not in found]:
+            self.write_changes(self.modules.pop(mod_file_path).files or {}, {})
+            print("{} removed".format(mod_file_path))
+
+    def write_changes(self, old_files: dict, new_files: dict):
+        for file_name, text in new_files.items():
+            if old_files.get(file_name) != text:
+                file_path = os.path.join(self.dp_folder, file_name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                write_file(file_path, text)
+
+        for file_name in old_files:
+            if file_name not in new_files:
+                try:
+                    os.remove(os.path.join(self.dp_folder, file_name))
+                except FileNotFoundError:
+                    pass  # Deleted by hand since it was written